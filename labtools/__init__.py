@@ -1,3 +1,5 @@
+__version__ = '0.1.0'
+
 from . import analysis
 from . import data
 from . import plot
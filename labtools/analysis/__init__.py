@@ -2,5 +2,6 @@ from .curve_regression import curve_regression, curve_format_formula
 from .linear_regression import linear_regression, linear_format_formula
 from .polynomial_regression import polynomial_regression, polynomial_format_formula
 
-from .statistics import calculate_statistics
-from .table_calculations import apply_formulas_to_dataframe # calculate_formula_values
+from .statistics import calculate_statistics, grouped_statistics, RunningStatistics
+from .table_calculations import apply_formulas_to_dataframe, format_rounded # calculate_formula_values
+from .resampling import bootstrap, jackknife
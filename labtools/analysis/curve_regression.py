@@ -5,33 +5,39 @@ Created on Sun Jul  5 20:31:29 2020
 @author: Jorge Pottiez López-Jurado
 """
 
-import numpy as np
 from scipy.odr import ODR, Model, RealData
 
-from ..uncertainties import round_with_uncertainty
+from ..uncertainties import round_with_uncertainty, split_uncertain
+from ..uncertainties.utils.arrays import check_measurements
 
 # Does Correct fitting with scipy curve_fit including errors in x?
 # https://stackoverflow.com/questions/26058792/correct-fitting-with-scipy-curve-fit-including-errors-in-x
 
-def curve_regression(x, y, δx, δy, function, initial_params=None, fit_type=0):
+def curve_regression(
+        x, y, δx=None, δy=None, function=None, initial_params=None, fit_type=0,
+        check=True
+        ):
     '''
     Perform regression with a custom function using Orthogonal Distance Regression (ODR).
 
     Parameters:
-        - x : array-like
+        - x : array-like or UncertainArray
             Independent variable
-        - y : array-like
+        - y : array-like or UncertainArray
             Dependent variable
         - δx : array-like or float
-            Uncertainty in x
+            Uncertainty in x (taken from x if it is an UncertainArray)
         - δy : array-like or float
-            Uncertainty in y
+            Uncertainty in y (taken from y if it is an UncertainArray)
         - function : callable
             Function to fit: f(params, x) -> y
         - initial_params : optional list
             Initial parameter estimates
         - fit_type : optional int
             0: explicit ODR, 1: implicit ODR, 2: ordinary least-squares
+        - check : optional bool
+            Whether to check the data for NaNs & negative uncertainties
+            (False for already validated data)
 
     Returns:
         dict, Regression results containing:
@@ -40,12 +46,13 @@ def curve_regression(x, y, δx, δy, function, initial_params=None, fit_type=0):
             - errors: Parameter uncertainties
             - function: The function used for fitting
     '''
-    # Handle default uncertainties
-    if isinstance(δx, (int, float)):
-        δx = np.full_like(x, δx)
-    if isinstance(δy, (int, float)):
-        δy = np.full_like(y, δy)
-    
+    x, δx = split_uncertain(x, δx)
+    y, δy = split_uncertain(y, δy)
+    if check:
+        check_measurements(x, δx, 'x')
+        check_measurements(y, δy, 'y')
+
+    # Constant uncertainties are passed as scalars, which ODR broadcasts
     # Default initial parameters
     if initial_params is None:
         initial_params = [1.0, 1.0] # Default to 2 parameters
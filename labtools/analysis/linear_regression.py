@@ -9,24 +9,28 @@ as an exercise to understand the underlying mathematics.
 """
 
 import numpy as np
-from ..uncertainties import round_with_uncertainty
+from ..uncertainties import round_with_uncertainty, split_uncertain
+from ..uncertainties.utils.arrays import check_measurements
 
 is_scalar = lambda x: isinstance(x, (int, float))
 
-def linear_regression(x, y, δx=None, δy=None):
+def linear_regression(x, y, δx=None, δy=None, check=True):
     """
     Perform linear regression, with or without uncertainties measurement.
     
     Parameters:
     -----------
-    x : array-like
+    x : array-like or UncertainArray
         Independent variable
-    y : array-like
+    y : array-like or UncertainArray
         Dependent variable
     δx : array-like or float, optional
-        Uncertainty in x
+        Uncertainty in x (taken from x if it is an UncertainArray)
     δy : array-like or float, optional
-        Uncertainty in y
+        Uncertainty in y (taken from y if it is an UncertainArray)
+    check : bool, optional
+        Whether to check the data for NaNs & negative uncertainties
+        (False for already validated data)
         
     Returns:
     --------
@@ -38,26 +42,32 @@ def linear_regression(x, y, δx=None, δy=None):
         - b_err: Slope error
         - r: Correlation coefficient
     """
+    x, δx = split_uncertain(x, δx)
+    y, δy = split_uncertain(y, δy)
+
+    # Contiguous float64 arrays, converted once (from Series or lists)
+    x = np.ascontiguousarray(x, dtype=float)
+    y = np.ascontiguousarray(y, dtype=float)
+    # Missing uncertainties are zero, constant ones are kept as scalars
+    δx = 0.0 if δx is None else δx if is_scalar(δx) else np.ascontiguousarray(δx, dtype=float)
+    δy = 0.0 if δy is None else δy if is_scalar(δy) else np.ascontiguousarray(δy, dtype=float)
+    if check:
+        check_measurements(x, δx, 'x')
+        check_measurements(y, δy, 'y')
+
+    # Sums of the centered data, shared by r, the coefficients and their errors
+    xm, ym = x.mean(), y.mean()
+    xc, yc = x - xm, y - ym
+    sums = _sufficient_statistics(xc, yc)
 
     # Calculate correlation coefficient
-    r = linear_correlation(x, y)
+    r = _correlation(sums)
     
     if is_scalar(δx) and is_scalar(δy):
-        a, b, δa, δb = _linear_regression_standard(x, y, δx, δy)
-    elif not is_scalar(δx) and not is_scalar(δy):
-        a, b, δa, δb = _linear_regression_weighted(x, y, δx, δy)
+        a, b, δa, δb = _linear_regression_standard(sums, xm, ym, δx, δy)
     else:
-        if is_scalar(δx):
-            δx = np.full_like(x, δx)
-        elif δx is None:
-            δx = np.zeros_like(x)
-        
-        if is_scalar(δy):
-            δy = np.full_like(y, δy)
-        elif δy is None:
-            δy = np.zeros_like(y)
-        
-        a, b, δa, δb = _linear_regression_weighted(x, y, δx, δy)
+        # Scalar uncertainties are broadcast by the weights
+        a, b, δa, δb = _linear_regression_weighted(xc, yc, sums, xm, ym, δx, δy)
     
     coeffs = [a, b]
     errors = [δa, δb]
@@ -107,26 +117,41 @@ def linear_correlation(x, y):
         - float
             Correlation coefficient
     '''
-    N_ = len(x) - 1 # n-1 for unbiased estimation
+    x = np.ascontiguousarray(x, dtype=float)
+    y = np.ascontiguousarray(y, dtype=float)
+    return _correlation(_sufficient_statistics(x - x.mean(), y - y.mean()))
 
-    # Means & standard desviation
-    xm, ym = x.mean(), y.mean()
-    sx = np.sqrt(sum( (x-xm)**2 ) / N_)
-    sy = np.sqrt(sum( (y-ym)**2 ) / N_)
-    # Covariance
-    sxy = sum( (x-xm)*(y-ym) ) / N_
+def _sufficient_statistics(x, y, w=None):
+    '''
+    (Weighted) sums of the data in a single matrix product,
+    [1, x, y]·W·[1, x, y]ᵀ, for centered data (numerically stable).
     
-    return sxy / (sx*sy)
+    Parameters:
+        - x : array, independent variable (centered)
+        - y : array, dependent variable (centered)
+        - w : array, optional, weights (1 if None)
+    Returns:
+        - tuple : Σw, Σwx, Σwy, Σwx², Σwxy, Σwy²
+    '''
+    data = np.array([np.ones_like(x), x, y])
+    gram = (data if w is None else data*w) @ data.T
+    return gram[0, 0], gram[0, 1], gram[0, 2], gram[1, 1], gram[1, 2], gram[2, 2]
 
-def _linear_regression_standard(x, y, δx, δy):
+def _correlation(sums):
+    '''Pearson's correlation coefficient from the sums of the centered data'''
+    _, _, _, Sxx, Sxy, Syy = sums
+    # The n-1 of the unbiased estimation cancels out
+    return Sxy / np.sqrt(Sxx*Syy)
+
+def _linear_regression_standard(sums, xm, ym, δx, δy):
     '''
     Standard least square fitting to y = A + B·x, with constant uncertainties.
     
     Parameters:
-        - x : array-like
-            Independent variable
-        - y : array-like
-            Dependent variable
+        - sums : tuple
+            Sums of the centered data (see _sufficient_statistics)
+        - xm, ym : float
+            Means of x and y
         - δx : float
             Uncertainty in x
         - δy : float
@@ -141,16 +166,15 @@ def _linear_regression_standard(x, y, δx, δy):
         - δB : float
             Slope error
     '''
-    N = len(x)
-    Σx, Σy = sum(x), sum(y)
-    Σx2 = sum(x**2)
-    Σxy = sum(x*y)
-    Δ = N*Σx2 - Σx**2
+    N, _, _, Sxx, Sxy, Syy = sums
+    # Sums of the data (centered x has Σx = 0)
+    Σx2 = Sxx + N*xm**2
+    Δ = N*Sxx
     # Regression coefficients
-    A = ( Σx2*Σy - Σx*Σxy )/Δ
-    B = ( N*Σxy - Σx*Σy )/Δ
-    # Theoretical error estimations
-    δy_teo = np.sqrt( sum((y - A - B*x)**2) / (N-2) )
+    B = Sxy / Sxx
+    A = ym - B*xm
+    # Theoretical error estimations (residuals from the sums, never negative)
+    δy_teo = np.sqrt( max(Syy - B*Sxy, 0) / (N-2) )
     δy_equiv = np.sqrt( δy**2 + (B*δx)**2 )
     δy = max(δy_equiv, δy_teo)
     # Slope uncertainties
@@ -159,18 +183,22 @@ def _linear_regression_standard(x, y, δx, δy):
     
     return A, B, δA, δB
 
-def _linear_regression_weighted(x, y, δx, δy):
+def _linear_regression_weighted(x, y, sums, xm, ym, δx, δy):
     '''
     Standar least square fitting with variable uncertainties.
     
     Parameters:
-        - x : array-like
-            Independent variable
-        - y : array-like
-            Dependent variable
-        - δx : array-like
+        - x : array
+            Independent variable (centered)
+        - y : array
+            Dependent variable (centered)
+        - sums : tuple
+            Sums of the centered data (see _sufficient_statistics)
+        - xm, ym : float
+            Means of x and y
+        - δx : array-like or float
             Uncertainty in x
-        - δy : array-like
+        - δy : array-like or float
             Uncertainty in y
     Returns:
         - A : float
@@ -182,24 +210,20 @@ def _linear_regression_weighted(x, y, δx, δy):
         - δB : float
             Slope error
     '''
-    N = len(x)
+    _, _, _, Sxx, Sxy, _ = sums
     # Initial δ estimate with a non weighted B
-    B_nw = ( N*sum(x*y) - sum(x)*sum(y) )/( N*sum(x**2) - sum(x)**2 )
-    δ = np.sqrt( δy**2 + (B_nw*δx)**2 )
+    B_nw = Sxy / Sxx
     # Weights
-    w = 1 / δ**2
+    w = np.broadcast_to(1 / ( δy**2 + (B_nw*δx)**2 ), x.shape)
     # Weighted sums
-    Σw = sum(w)
-    Σwx = sum(w*x)
-    Σwx2 = sum(w*x**2)
-    Σwy = sum(w*y)
-    Σwxy = sum(w*x*y)
-    # Weighted regression coefficients
+    Σw, Σwx, Σwy, Σwx2, Σwxy, _ = _sufficient_statistics(x, y, w)
+    # Weighted regression coefficients (of the centered data)
     Δ = Σw*Σwx2-Σwx**2 
-    A = (Σwx2*Σwy-Σwx*Σwxy)/Δ
+    A = (Σwx2*Σwy-Σwx*Σwxy)/Δ + ym
     B = (Σw*Σwxy-Σwx*Σwy)/Δ
-    # Their uncertainty
-    δA = np.sqrt(Σwx2/Δ)
+    A -= B*xm
+    # Their uncertainty (Σwx² of the data, not centered)
+    δA = np.sqrt((Σwx2 + 2*xm*Σwx + xm**2*Σw)/Δ)
     δB = np.sqrt(Σw/Δ)
     
-    return A, B, δA, δB
\ No newline at end of file
+    return A, B, δA, δB
@@ -6,19 +6,22 @@ Created on Sun Jul  5 20:31:29 2020
 """
 
 import numpy as np
-from ..uncertainties import round_with_uncertainty
+from ..uncertainties import round_with_uncertainty, split_uncertain
+from ..uncertainties.utils.arrays import check_measurements
 
-def polynomial_regression(x, y, δx=None, δy=None, degree=3):
+def polynomial_regression(x, y, δx=None, δy=None, degree=3, check=True):
     '''
     Perform polynomial regression, with or without uncertainties measurement.
     Based on numpy.polyfit.
     
     Parameters:
-        - x : array-like, independent variable
-        - y : array-like, dependent variable
-        - δx : array-like, uncertainties in x
-        - δy : array-like, uncertainties in y
+        - x : array-like or UncertainArray, independent variable
+        - y : array-like or UncertainArray, dependent variable
+        - δx : array-like, uncertainties in x (taken from x if it is an UncertainArray)
+        - δy : array-like, uncertainties in y (taken from y if it is an UncertainArray)
         - degree : int, polynomial degree
+        - check : bool, whether to check the data for NaNs & negative
+            uncertainties (False for already validated data)
     Returns:
         dict, Regression results containing:
             - coefficients: Array of coefficients (highest degree first) 
@@ -26,12 +29,17 @@ def polynomial_regression(x, y, δx=None, δy=None, degree=3):
             - poly_model: np.poly1d object
             - degree: int, polynomial
         '''
+    x, δx = split_uncertain(x, δx)
+    y, δy = split_uncertain(y, δy)
+    if check:
+        check_measurements(x, δx, 'x')
+        check_measurements(y, δy, 'y')
     
     if δx is None and δy is None:
         coeffs, errors = _polynomial_regression_standard(x, y, degree)
     elif δx is None or δy is None:
-        δx = np.zeros_like(x) if δx is None else δx
-        δy = np.zeros_like(y) if δy is None else δy
+        δx = 0.0 if δx is None else δx
+        δy = 0.0 if δy is None else δy
         coeffs, errors = _polynomial_regression_weighted(x, y, δx, δy, degree)
     else:
         coeffs, errors = _polynomial_regression_weighted(x, y, δx, δy, degree)
@@ -117,8 +125,8 @@ def _polynomial_regression_weighted(x, y, δx, δy, degree):
     coeffs_nw, errors_nw = _polynomial_regression_standard(x, y, degree)
     δy_est = np.polyval(coeffs_nw, δx)
 
-    # Weights for the least squares fit
-    weights = 1 / np.sqrt((δy_est)**2 + δy**2)
+    # Weights for the least squares fit (a view for constant uncertainties)
+    weights = np.broadcast_to(1 / np.sqrt((δy_est)**2 + δy**2), np.shape(x))
     
     # Perform weighted polynomial fit
     coeffs, cov = np.polyfit(x, y, degree, w=weights, cov=True)
@@ -126,4 +134,4 @@ def _polynomial_regression_weighted(x, y, δx, δy, degree):
     # Errors (based on the covariance diagonal)
     errors = np.sqrt(np.diag(cov))
     
-    return coeffs, max(errors_nw, errors)
\ No newline at end of file
+    return coeffs, np.maximum(errors_nw, errors)
\ No newline at end of file
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Bootstrap and jackknife estimates of the uncertainty of means and fits.
+
+The indices of all the replicates are generated at once, as an (R, N)
+matrix, and constant uncertainties are kept as scalars. Means and
+closed-form fits (linear, polynomial) are then evaluated for all the
+replicates as batched array operations, while ODR fits
+(curve_regression) are run in chunks, each chunk drawing its indices from
+its own random stream, so the results only depend on the seed. The chunks
+can be dispatched to a process pool (n_workers > 1), which needs a
+picklable (module-level) fit function: lambdas and functions defined in a
+notebook are fitted serially.
+"""
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from ..uncertainties import split_uncertain
+from .linear_regression import linear_regression
+from .polynomial_regression import polynomial_regression
+from .curve_regression import curve_regression
+
+# Default number of bootstrap replicates
+N_RESAMPLES = 1000
+# Replicates per ODR task (and random stream)
+CHUNK_SIZE = 50
+FITS = ('mean', 'linear', 'polynomial', 'curve')
+
+def bootstrap_indices(n, n_resamples=N_RESAMPLES, rng=None):
+    '''
+    Indices of all the bootstrap replicates, drawn with replacement.
+
+    Parameters:
+        - n : int, number of samples
+        - n_resamples : int, number of replicates
+        - rng : np.random.Generator or int, optional, random generator or seed
+    Returns:
+        - array of int, (n_resamples, n) indices
+    '''
+    return np.random.default_rng(rng).integers(0, n, size=(n_resamples, n))
+
+def jackknife_indices(n):
+    '''
+    Indices of the n jackknife replicates, each leaving one sample out.
+
+    Parameters:
+        - n : int, number of samples
+    Returns:
+        - array of int, (n, n-1) indices
+    '''
+    kept = np.arange(n - 1)
+    return kept + (kept >= np.arange(n)[:, None])
+
+def bootstrap(
+        x, y=None, δx=None, δy=None, fit='mean', n_resamples=N_RESAMPLES, seed=None,
+        confidence=0.95, **kwargs
+        ):
+    '''
+    Bootstrap estimate of the uncertainty of a mean or of fit parameters.
+
+    Parameters:
+        - x : array-like or UncertainArray, values ((K, N) for K means) or
+            independent variable of the fit
+        - y : array-like or UncertainArray, dependent variable (fits only)
+        - δx, δy : array-like or float, optional, uncertainties
+            (taken from x & y if they are UncertainArrays)
+        - fit : str, 'mean', 'linear', 'polynomial' or 'curve'
+        - n_resamples : int, number of replicates
+        - seed : int, optional, random seed
+        - confidence : float, confidence level of the percentile interval
+        - kwargs : fit options: degree ('polynomial'), function, initial_params
+            & fit_type ('curve'), n_workers ('curve', processes of the pool,
+            default 1: serial fits; pooled fits need a module-level function)
+    Returns:
+        - dict :
+            - estimate : array, estimate of the full data
+            - errors : array, analytic errors of the estimate
+            - σ : array, standard deviation of the replicates
+            - interval : tuple of arrays, (lower, upper) percentile interval
+                (normal interval, estimate ± z·σ, for the jackknife)
+            - replicates : array, (R, P) estimates of the replicates
+            - summary : pd.DataFrame, one row per estimated parameter
+    '''
+    return _resample(
+        'bootstrap', x, y, δx, δy, fit, n_resamples, seed, confidence, **kwargs
+        )
+
+def jackknife(x, y=None, δx=None, δy=None, fit='mean', confidence=0.95, **kwargs):
+    '''
+    Jackknife (leave-one-out) estimate of the uncertainty of a mean or of
+    fit parameters. Same parameters & results as bootstrap, the σ being the
+    jackknife standard error.
+    '''
+    return _resample('jackknife', x, y, δx, δy, fit, None, None, confidence, **kwargs)
+
+def _resample(method, x, y, δx, δy, fit, n_resamples, seed, confidence, **kwargs):
+    if fit not in FITS:
+        raise ValueError(f"Invalid fit: {fit}. Must be one of {FITS}.")
+    x, δx = split_uncertain(x, δx)
+    y, δy = split_uncertain(y, δy)
+    # Float arrays (converted once), constant uncertainties as floats
+    as_input = lambda a: (
+        a if a is None else float(a) if np.ndim(a) == 0 else np.asarray(a, dtype=float)
+        )
+    x, y, δx, δy = (as_input(a) for a in (x, y, δx, δy))
+    N = x.shape[-1]
+
+    # Estimate & analytic errors of the full data
+    estimate, errors = _full_fit(fit, x, y, δx, δy, **kwargs)
+
+    if fit == 'curve':
+        replicates = _curve_replicates(method, x, y, δx, δy, n_resamples, seed, **kwargs)
+    else:
+        if method == 'bootstrap':
+            indices = bootstrap_indices(N, n_resamples, seed)
+        else:
+            indices = jackknife_indices(N)
+        take = lambda a: a if np.ndim(a) == 0 else a[..., indices]
+        replicates = _batched_fit(fit, take(x), take(y), take(δx), take(δy), **kwargs)
+
+    # σ & interval of the replicates
+    if method == 'bootstrap':
+        σ = np.nanstd(replicates, axis=0, ddof=1)
+        tail = 50 * (1 - confidence)
+        lower, upper = np.nanpercentile(replicates, [tail, 100 - tail], axis=0)
+    else:
+        σ = np.sqrt((N - 1) * np.nanmean(
+            (replicates - np.nanmean(replicates, axis=0))**2, axis=0
+            ))
+        # Leave-one-out replicates don't spread like the estimate
+        z = norm.ppf(0.5 + confidence/2)
+        lower, upper = estimate - z*σ, estimate + z*σ
+
+    summary = pd.DataFrame({
+        'Estimate': estimate,
+        'Analytic Error': errors,
+        f'{method.capitalize()} σ': σ,
+        f'Lower ({confidence:.0%})': lower,
+        f'Upper ({confidence:.0%})': upper,
+        })
+    return {
+        'estimate': estimate,
+        'errors': errors,
+        'σ': σ,
+        'interval': (lower, upper),
+        'replicates': replicates,
+        'summary': summary,
+        }
+
+def _full_fit(fit, x, y, δx, δy, degree=3, function=None, initial_params=None,
+              fit_type=0, n_workers=1):
+    '''Estimate and analytic errors of the full data, as 1-D arrays'''
+    if fit == 'mean':
+        N = x.shape[-1]
+        estimate = np.mean(x, axis=-1)
+        if δx is None:
+            errors = np.std(x, axis=-1, ddof=1) / np.sqrt(N)
+        else:
+            errors = np.sqrt(np.sum(np.broadcast_to(δx**2, x.shape), axis=-1)) / N
+    elif fit == 'linear':
+        results = linear_regression(x, y, δx, δy)
+        estimate, errors = results['coefficients'], results['errors']
+    elif fit == 'polynomial':
+        results = polynomial_regression(x, y, δx, δy, degree)
+        estimate, errors = results['coefficients'], results['errors']
+    else:
+        results = curve_regression(x, y, δx, δy, function, initial_params, fit_type)
+        estimate, errors = results['parameters'], results['errors']
+    return np.atleast_1d(estimate), np.atleast_1d(errors)
+
+def _batched_fit(fit, x, y, δx, δy, degree=3, **kwargs):
+    '''
+    Estimates of all the replicates at once, (R, N) samples each.
+
+    Returns:
+        - array, (R, P) estimates
+    '''
+    if fit == 'mean':
+        # (R,) for one variable, (K, R) for K variables
+        means = np.mean(x, axis=-1)
+        return means[:, None] if means.ndim == 1 else means.T
+    elif fit == 'linear':
+        return np.stack(_batched_linear(x, y, δx, δy), axis=-1)
+    return _batched_polynomial(x, y, δx, δy, degree)
+
+def _batched_linear(x, y, δx, δy):
+    '''
+    Intercepts & slopes of linear_regression for all the replicates,
+    from sums along the last axis.
+    '''
+    N = x.shape[-1]
+    Σ = lambda a: np.sum(a, axis=-1)
+    Σx, Σy, Σx2, Σxy = Σ(x), Σ(y), Σ(x**2), Σ(x*y)
+    Δ = N*Σx2 - Σx**2
+    A = (Σx2*Σy - Σx*Σxy) / Δ
+    B = (N*Σxy - Σx*Σy) / Δ
+    if np.ndim(δx) == 0 and np.ndim(δy) == 0:
+        # Constant (or missing) uncertainties: standard fit
+        return A, B
+
+    # Weighted fit, with the non weighted slope for the initial δ estimate
+    δx = 0.0 if δx is None else δx
+    δy = 0.0 if δy is None else δy
+    w = 1 / (δy**2 + (B[..., None]*δx)**2)
+    Σw, Σwx, Σwx2, Σwy, Σwxy = Σ(w), Σ(w*x), Σ(w*x**2), Σ(w*y), Σ(w*x*y)
+    Δ = Σw*Σwx2 - Σwx**2
+    A = (Σwx2*Σwy - Σwx*Σwxy) / Δ
+    B = (Σw*Σwxy - Σwx*Σwy) / Δ
+    return A, B
+
+def _batched_polynomial(x, y, δx, δy, degree):
+    '''
+    Coefficients of polynomial_regression (highest degree first) for all the
+    replicates, by batched least squares.
+    '''
+    vandermonde = x[..., None] ** np.arange(degree, -1, -1)
+    coeffs = _least_squares(vandermonde, y)
+    if δx is None and δy is None:
+        return coeffs
+
+    δx = 0.0 if δx is None else δx
+    δy = 0.0 if δy is None else δy
+    # Initial estimate with a non weighted fit, as in polynomial_regression
+    δy_est = np.sum(
+        coeffs[..., None, :] * np.asarray(δx)[..., None] ** np.arange(degree, -1, -1),
+        axis=-1
+        )
+    weights = 1 / np.sqrt(δy_est**2 + δy**2)
+    return _least_squares(vandermonde * weights[..., None], y * weights)
+
+def _least_squares(matrix, rhs):
+    '''Stacked least squares solutions of matrix·c = rhs, (R, N, P) & (R, N)'''
+    return np.einsum('...pn,...n->...p', np.linalg.pinv(matrix), rhs)
+
+def _curve_replicates(
+        method, x, y, δx, δy, n_resamples, seed, function=None, initial_params=None,
+        fit_type=0, n_workers=1, **kwargs
+        ):
+    '''
+    ODR fits of all the replicates, in chunks, dispatched to a process pool
+    if n_workers > 1 and the function can be pickled (serially otherwise)
+    '''
+    N = x.shape[-1]
+    if method == 'bootstrap':
+        sizes = [CHUNK_SIZE] * (n_resamples // CHUNK_SIZE)
+        if n_resamples % CHUNK_SIZE:
+            sizes.append(n_resamples % CHUNK_SIZE)
+        # One independent random stream per chunk
+        streams = np.random.SeedSequence(seed).spawn(len(sizes))
+        tasks = [('bootstrap', size, stream) for size, stream in zip(sizes, streams)]
+    else:
+        rows = np.array_split(np.arange(N), max(1, -(-N // CHUNK_SIZE)))
+        tasks = [('jackknife', rows_chunk, None) for rows_chunk in rows]
+
+    arguments = [
+        (task, x, y, δx, δy, function, initial_params, fit_type) for task in tasks
+        ]
+    if n_workers > 1 and len(tasks) > 1 and _picklable(function):
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(tasks))) as pool:
+            chunks = list(pool.map(_curve_chunk, arguments))
+    else:
+        chunks = [_curve_chunk(args) for args in arguments]
+    return np.concatenate(chunks)
+
+def _picklable(function):
+    '''Whether the function can be sent to the workers of a process pool'''
+    try:
+        pickle.dumps(function)
+    except Exception:
+        return False
+    return True
+
+def _curve_chunk(arguments):
+    '''ODR fits of a chunk of replicates (run by the workers of the pool)'''
+    (method, chunk, stream), x, y, δx, δy, function, initial_params, fit_type = arguments
+    N = x.shape[-1]
+    if method == 'bootstrap':
+        indices = bootstrap_indices(N, chunk, np.random.default_rng(stream))
+    else:
+        indices = jackknife_indices(N)[chunk]
+
+    take = lambda a, i: a if np.ndim(a) == 0 else a[i]
+    return np.array([
+        curve_regression(
+            x[i], y[i], take(δx, i), take(δy, i), function, initial_params, fit_type,
+            check=False
+            )['parameters']
+        for i in indices
+        ])
@@ -1,58 +1,67 @@
 import numpy as np
-from ..uncertainties import isiterable, rounder
+import pandas as pd
+from ..uncertainties import rounder, split_uncertain
+from ..uncertainties.utils.arrays import check_measurements
+from ..data import UncertainTable
 
-'Basic statistics functions with uncertainties'
+'Basic statistics functions with uncertainties, reduced along an axis (samples)'
 # Standard mean & its error
-mean  = lambda x  : np.mean(x)
-δmean = lambda δx : np.sqrt(np.sum(δx**2)) / len(δx)
+mean  = lambda x, axis=-1  : np.mean(x, axis=axis)
+δmean = lambda δx, axis=-1 : np.sqrt(np.sum(δx**2, axis=axis)) / np.shape(δx)[axis]
 # Weighted mean formulas
 w = lambda δx : 1/(δx**2)
-mean_weighted  = lambda x,δx : np.sum(x*w(δx)) / np.sum(w(δx))
-δmean_weighted = lambda δx   : 1 / np.sqrt(np.sum(w(δx)))
+mean_weighted  = lambda x,δx, axis=-1 : (
+    np.sum(x*w(δx), axis=axis) / np.sum(w(δx), axis=axis)
+)
+δmean_weighted = lambda δx, axis=-1   : 1 / np.sqrt(np.sum(w(δx), axis=axis))
 # Standard deviation & its error
-std  = lambda x  : np.std(x)
-std_weighted  = lambda x,δx : (
-    np.sqrt(np.sum(w(δx)*(x - mean_weighted(x,δx))**2) / np.sum(w(δx)))
+std  = lambda x, axis=-1  : np.std(x, axis=axis)
+std_weighted  = lambda x,δx, axis=-1 : np.sqrt(
+    np.sum(w(δx)*(x - np.expand_dims(mean_weighted(x,δx,axis), axis))**2, axis=axis)
+    / np.sum(w(δx), axis=axis)
 )
 
 def relative_uncertainty(x, δx):
     """
     Calculate relative(s) uncertainty(ies) as a percentage.
-    
+
     Parameters:
         - x : float or array-like, value(s)
         - δx : float or array-like, uncertainty(ies)
     Returns:
         - str or list : Formatted string(s) "xx.xx %"
     """
-    if isiterable(x):
-        rel_uncertainties = [ relative_uncertainty(xi, δxi) for xi, δxi in zip(x, δx) ]
-        return [ relative_uncertainty(xi, δxi) for xi, δxi in zip(x, δx) ]
-    else:
-        if x == 0:
-            return "∞ %" if δx != 0 else "0.00 %"
-        else:
-            return f"{abs(δx/x)*100:.2f} %"
+    x, δx = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(δx, dtype=float))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentages = np.abs(δx/x) * 100
+    # Zero values: infinite relative uncertainty, unless it is zero too
+    percentages = np.where((x == 0) & (δx == 0), 0, percentages)
+    strings = np.char.mod('%.2f %%', percentages)
+    strings = np.where((x == 0) & (δx != 0), '∞ %', strings)
+    return str(strings) if x.ndim == 0 else strings.tolist()
 
 def relative_error(x_obs, x_exp):
     '''
     Calculate relative error(s) as a percentage.
-    
+
     Parameters:
         - x_obs : float or array-like, observed value(s)
         - x_exp : float or array-like, expected value(s)
     Returns:
         - str or list : Formatted string(s) "xx.xx %"
     '''
-    if isiterable(x_obs) and isiterable(x_exp):
-        return [ relative_error(xi, xei) for xi, xei in zip(x_obs, x_exp) ]
-    else:
-        return f"{ abs( (x_obs - x_exp) / x_exp )*100 :.2f} %"
+    x_obs, x_exp = np.broadcast_arrays(
+        np.asarray(x_obs, dtype=float), np.asarray(x_exp, dtype=float)
+        )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentages = np.abs((x_obs - x_exp) / x_exp) * 100
+    strings = np.char.mod('%.2f %%', percentages)
+    return str(strings) if x_obs.ndim == 0 else strings.tolist()
 
 def relative_uncertainty_from_string(rounded_str):
     '''
     Calculate relative uncertainty from a formatted "value ± uncertainty" string.
-    
+
     Parameters:
         - rounded_str : str
     Returns:
@@ -61,17 +70,24 @@ def relative_uncertainty_from_string(rounded_str):
     x, δx = ( float(i) for i in rounded_str.split(' ± ') )
     return relative_uncertainty(x, δx)
 
-def calculate_statistics(variables, x, δx, x_exp = None):
+def calculate_statistics(variables, x, δx=None, x_exp = None, axis=-1, check=True):
     '''
     Calculate statistics for a given set of values:
     Mean(s), standard deviation(s), relative uncertainty(ies),
     and relative error(s) (if expected value(s) provided).
+    The statistics of all the variables are computed at once, reducing the
+    samples' axis, and only formatted at the end.
 
     Parameters:
         - variables : str or list, Variable(s) or symbol(s) of the variable(s) to compare
-        - x : array-like or matrix-like, value(s)
+        - x : array-like, matrix-like or UncertainArray, value(s),
+            (N,) for one variable or (K, N) for K variables
         - δx : array-like or matrix-like, uncertainty(ies)
+            (taken from x if it is an UncertainArray)
         - x_exp : float or array-like, expected value(s) (default: None)
+        - axis : int, axis of the samples (default: -1)
+        - check : bool, whether to check the data for NaNs & negative
+            uncertainties (False for already validated data)
     Returns:
         - dict :
             - Variable : str or list, variables
@@ -81,33 +97,234 @@ def calculate_statistics(variables, x, δx, x_exp = None):
                 - Rel Uncert : str or list, relative uncertainty(ies)
                 - Rel Error : str or list, relative error(s) (if x_exp provided)
     '''
-    if np.ndim(x) == 1:
-        m = mean(x)
-        δm = δmean(δx)
+    x, δx = split_uncertain(x, δx)
+    x = np.asarray(x, dtype=float)
+    # Constant uncertainties are broadcast as a view
+    δx = np.broadcast_to(np.asarray(δx, dtype=float), x.shape)
+    if check:
+        check_measurements(x, δx, variables)
+
+    # Reductions shared by the standard & weighted statistics
+    weights = w(δx)
+    sum_weights = np.sum(weights, axis=axis)
+
+    m = mean(x, axis)
+    δm = δmean(δx, axis)
+    m_w = np.sum(x*weights, axis=axis) / sum_weights
+    δm_w = 1 / np.sqrt(sum_weights)
+    σ = std(x, axis)
+    σ_w = np.sqrt(
+        np.sum(weights*(x - np.expand_dims(m_w, axis))**2, axis=axis) / sum_weights
+    )
+
+    # Errors of the means are non-negative for checked uncertainties
+    return _format_statistics(variables, m, δm, σ, m_w, δm_w, σ_w, x_exp, check)
+
+def grouped_statistics(table, by, variables):
+    '''
+    Calculate the standard & weighted statistics of every group of repeated
+    measurements (e.g. several trials per voltage) in one vectorized pass:
+    the rows are sorted by group once and reduced per segment (np.add.reduceat).
+
+    Parameters:
+        - table : UncertainTable or pandas.DataFrame, data with the variables
+        - by : str, magnitude (or dataframe column) whose values define the groups
+        - variables : str, comma-separated variable names
+    Returns:
+        - pandas.DataFrame : one row per group & variable, with the number of
+            samples, the (weighted) means, their errors and standard deviations,
+            and the formatted means & relative uncertainties
+    '''
+    if isinstance(table, pd.DataFrame):
+        dataframe = table
+        table = UncertainTable.from_dataframe(dataframe)
+        keys = dataframe[by].to_numpy() if by in dataframe.columns else table.value(by)
     else:
-        m = [ mean(xi) for xi in x ]
-        δm = [ δmean(δxi) for δxi in δx ]
-    
+        keys = table.value(by)
+    values, uncertainties = table.get(variables)
+    names = [v.strip() for v in variables.split(',')]
+    N = len(keys)
+
+    # Rows sorted by group, one contiguous segment per group
+    order = np.argsort(keys, kind='stable')
+    groups, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+    x = np.array(values)[:, order]
+    δx = np.array([np.broadcast_to(δxi, N) for δxi in uncertainties])[:, order]
+    reduce = lambda a: np.add.reduceat(a, starts, axis=-1)
+    expand = lambda a: np.repeat(a, counts, axis=-1)
+
+    # (K, G) statistics
+    weights = w(δx)
+    sum_weights = reduce(weights)
+    m = reduce(x) / counts
+    δm = np.sqrt(reduce(δx**2)) / counts
+    m_w = reduce(x*weights) / sum_weights
+    δm_w = 1 / np.sqrt(sum_weights)
+    σ = np.sqrt(reduce((x - expand(m))**2) / counts)
+    σ_w = np.sqrt(reduce(weights*(x - expand(m_w))**2) / sum_weights)
+
+    # Tidy table, one row per group & variable
+    K, G = m.shape
+    flat = lambda a: a.T.ravel()
+    return pd.DataFrame({
+        by: np.repeat(groups, K),
+        'Variable': np.tile(names, G),
+        'N': np.repeat(counts, K),
+        'Mean': flat(m),
+        'δMean': flat(δm),
+        'Std': flat(σ),
+        'Weighted Mean': flat(m_w),
+        'δWeighted Mean': flat(δm_w),
+        'Weighted Std': flat(σ_w),
+        'Rounded Mean': rounder(flat(m), flat(δm), check=False),
+        'Rel Uncert': relative_uncertainty(flat(m), flat(δm)),
+        'Rounded Weighted Mean': rounder(flat(m_w), flat(δm_w), check=False),
+        'Weighted Rel Uncert': relative_uncertainty(flat(m_w), flat(δm_w)),
+        })
+
+def _format_statistics(variables, m, δm, σ, m_w, δm_w, σ_w, x_exp=None, check=True):
+    '''Output dict of calculate_statistics, from the (unformatted) statistics'''
+    tolist = lambda a: np.asarray(a).tolist()
     stats_std = {
-        'Mean': rounder(m, δm),
-        'Std' : std(x),
+        'Mean': rounder(tolist(m), tolist(δm), check=check),
+        'Std' : tolist(σ),
         'Rel Uncert': relative_uncertainty(m, δm)
     }
-    if x_exp:
-        stats_std['Rel Error'] = relative_error(m, x_exp)
-    
-    m_w = mean_weighted(x, δx)
-    δm_w = δmean_weighted(δx)
     stats_w = {
-        'Mean': rounder(m_w, δm_w),
-        'Std' : std_weighted(x, δx),
+        'Mean': rounder(tolist(m_w), tolist(δm_w), check=check),
+        'Std' : tolist(σ_w),
         'Rel Uncert': relative_uncertainty(m_w, δm_w)
     }
-    if x_exp:
+    if x_exp is not None:
+        stats_std['Rel Error'] = relative_error(m, x_exp)
         stats_w['Rel Error'] = relative_error(m_w, x_exp)
 
     return {
         'Variable': variables,
         'Standard': stats_std,
         'Weighted': stats_w
-        }
\ No newline at end of file
+        }
+
+class RunningStatistics:
+    '''
+    Accumulator of the statistics of calculate_statistics, updated chunk by
+    chunk so that the data needn't fit in memory. Each chunk is reduced with
+    NumPy and combined with the accumulated statistics by numerically stable
+    (Chan/Welford) updates of the plain and inverse-variance-weighted means
+    and sums of squared deviations. Accumulators of different chunks or
+    processes can be merged. Without samples, the statistics are nan.
+
+    Attributes:
+        - n : int, number of samples
+        - mean, std, δmean : arrays, standard statistics (one per variable)
+        - weighted_mean, weighted_std, δweighted_mean : arrays, weighted statistics
+    '''
+    def __init__(self):
+        self.n = 0
+        self._mean = self._weighted_mean = np.nan
+        self._m2 = self._sum_δx2 = self._sum_weights = self._weighted_m2 = 0.0
+
+    def __repr__(self):
+        return f'RunningStatistics(n={self.n})'
+
+    def update(self, x, δx=None):
+        '''
+        Add a chunk of samples.
+
+        Parameters:
+            - x : array-like or UncertainArray, values, (N,) for one variable
+                or (K, N) for K variables
+            - δx : array-like or float, uncertainties (taken from x if it is
+                an UncertainArray)
+        Returns:
+            - RunningStatistics : self
+        '''
+        x, δx = split_uncertain(x, δx)
+        x = np.asarray(x, dtype=float)
+        δx = np.broadcast_to(np.asarray(δx, dtype=float), x.shape)
+        if x.shape[-1] == 0:
+            return self
+
+        chunk = RunningStatistics()
+        chunk.n = x.shape[-1]
+        chunk._mean = mean(x)
+        chunk._m2 = np.sum((x - chunk._mean[..., None])**2, axis=-1)
+        chunk._sum_δx2 = np.sum(δx**2, axis=-1)
+        weights = w(δx)
+        chunk._sum_weights = np.sum(weights, axis=-1)
+        chunk._weighted_mean = np.sum(x*weights, axis=-1) / chunk._sum_weights
+        chunk._weighted_m2 = np.sum(
+            weights*(x - chunk._weighted_mean[..., None])**2, axis=-1
+            )
+        return self.merge(chunk)
+
+    def merge(self, other):
+        '''
+        Add the samples of another accumulator (of the same variables).
+
+        Parameters:
+            - other : RunningStatistics
+        Returns:
+            - RunningStatistics : self
+        '''
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.__dict__.update(other.__dict__)
+            return self
+
+        n = self.n + other.n
+        delta = other._mean - self._mean
+        self._mean = self._mean + delta * other.n / n
+        self._m2 = self._m2 + other._m2 + delta**2 * self.n * other.n / n
+        self._sum_δx2 = self._sum_δx2 + other._sum_δx2
+
+        sum_weights = self._sum_weights + other._sum_weights
+        delta = other._weighted_mean - self._weighted_mean
+        self._weighted_mean = self._weighted_mean + delta * other._sum_weights / sum_weights
+        self._weighted_m2 = (
+            self._weighted_m2 + other._weighted_m2
+            + delta**2 * self._sum_weights * other._sum_weights / sum_weights
+            )
+        self._sum_weights = sum_weights
+        self.n = n
+        return self
+
+    @property
+    def mean(self):
+        return self._mean
+
+    @property
+    def δmean(self):
+        return np.sqrt(self._sum_δx2) / self.n if self.n else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self._m2 / self.n) if self.n else np.nan
+
+    @property
+    def weighted_mean(self):
+        return self._weighted_mean
+
+    @property
+    def δweighted_mean(self):
+        return 1 / np.sqrt(self._sum_weights) if self.n else np.nan
+
+    @property
+    def weighted_std(self):
+        return np.sqrt(self._weighted_m2 / self._sum_weights) if self.n else np.nan
+
+    def statistics(self, variables, x_exp=None):
+        '''
+        Statistics of all the samples, formatted as by calculate_statistics.
+
+        Parameters:
+            - variables : str or list, Variable(s) or symbol(s) of the variable(s)
+            - x_exp : float or array-like, expected value(s) (default: None)
+        Returns:
+            - dict : see calculate_statistics
+        '''
+        return _format_statistics(
+            variables, self.mean, self.δmean, self.std,
+            self.weighted_mean, self.δweighted_mean, self.weighted_std, x_exp
+            )
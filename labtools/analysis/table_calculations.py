@@ -6,13 +6,21 @@ This module provides functions for applying formulas to tabular data with
 uncertainty propagation and exporting the results.
 """
 
+import warnings
+
+import numpy as np
 import pandas as pd
 
 from ..uncertainties import rounder, propagate_uncertainty, get_latex_equations
+from ..uncertainties.format_round import round_numeric, format_with_uncertainty
+from ..uncertainties.utils.covariance import budget_shares
 from ..data import get_excel_data_and_uncertainties
 from .statistics import calculate_statistics
 
-def calculate_formula_values(variables, equation, data_values, data_uncertainties, dependency='Independent'):
+def calculate_formula_values(
+        variables, equation, data_values, data_uncertainties,
+        dependency='Independent', backend='auto'
+        ):
     """
     Calculate formula values and propagate uncertainties for tabular data.
     
@@ -26,7 +34,9 @@ def calculate_formula_values(variables, equation, data_values, data_uncertaintie
         - data_uncertainties : list
             List of arrays with variable uncertainties
         - dependency : str
-            'Dependent' or 'Independent' variables
+            'Dependent', 'Independent' or 'SecondOrder' (bias-corrected) propagation
+        - backend : str
+            Numeric backend ('numpy', 'numexpr', 'math' or 'auto')
     
     Returns:
         - tuple : (result_name, result_values, result_uncertainties, latex_formulas)
@@ -38,7 +48,8 @@ def calculate_formula_values(variables, equation, data_values, data_uncertaintie
     
     # Calculate values with uncertainty propagation
     result_values, result_uncertainties = propagate_uncertainty(
-        variables, expression, data_values, data_uncertainties, dependency
+        variables, expression, data_values, data_uncertainties, dependency,
+        backend=backend
     )
     
     # Get LaTeX formulas
@@ -48,9 +59,15 @@ def calculate_formula_values(variables, equation, data_values, data_uncertaintie
     
     return result_name, result_values, result_uncertainties, [formula_latex, uncertainty_latex]
 
-def apply_formulas_to_dataframe(dataframe, variables, equations, dependency='Independent'):
+def apply_formulas_to_dataframe(
+        dataframe, variables, equations, dependency='Independent', backend='auto',
+        latex=True, table=None, covariance=False, budget=False, numeric=False
+        ):
     """
     Apply multiple formulas to a dataframe and calculate values with uncertainties.
+    All the formulas are compiled into a single kernel and evaluated in one pass.
+    Equations can use the results of other equations (in any order), their
+    uncertainties are propagated through the whole chain.
     
     Parameters:
         - dataframe : pandas.DataFrame
@@ -60,15 +77,40 @@ def apply_formulas_to_dataframe(dataframe, variables, equations, dependency='Ind
         - equations : str, list
             List of formula equations
         - dependency : str or list
-            'Dependent' or 'Independent' variables
+            'Dependent', 'Independent' or 'SecondOrder' (bias-corrected) propagation
+        - backend : str
+            Numeric backend ('numpy', 'numexpr', 'math' or 'auto')
+        - latex : bool
+            Whether to add the LaTeX formulas to the summary
+        - table : UncertainTable, optional
+            Already parsed table of the dataframe (its headers aren't parsed again)
+        - covariance : bool
+            Whether to add the covariance between each pair of results, as
+            'cov(a, b)' columns (first order, for uncorrelated variables).
+            Only for pairs of 'Independent' results, whose uncertainties are
+            the square roots of its diagonal
+        - budget : bool
+            Whether to add the uncertainty budget of each result: the
+            contribution of each variable, |∂f/∂x|·δx, and its share as
+            'δf[x]' & 'δf[x] (%)' columns, and the shares of the mean's
+            uncertainty to the summary
+        - numeric : bool
+            Whether to keep the results as numbers only, without the
+            'value ± uncertainty' string columns: their value & uncertainty
+            columns are listed in computed_dataframe.attrs['rounding'] (see
+            format_rounded), and the Excel export writes them rounded, with
+            matching number formats
     
     Returns:
         - tuple : (computed_dataframe, summary_dataframe)
     """
+    # sympy is only imported when the kernels aren't in the kernel cache
+    from ..uncertainties.kernel_cache import get_cached_equations
+
     # Get the variable data and uncertainties from the dataframe
-    data_values, data_uncertainties = get_excel_data_and_uncertainties(variables, dataframe)
-    computed_df = dataframe.copy()
-    summary_data = []
+    data_values, data_uncertainties = get_excel_data_and_uncertainties(
+        variables, dataframe if table is None else table
+        )
     
     if isinstance(equations, str):
         if ',' in equations:
@@ -81,32 +123,132 @@ def apply_formulas_to_dataframe(dataframe, variables, equations, dependency='Ind
     else:
         dependencies = dependency
 
-    # Process each equation
-    for equation, dependency in zip(equations, dependencies):
-        # Calculate formula values
-        result_name, values, uncertainties, latex_formulas = calculate_formula_values(
-            variables, equation, data_values, data_uncertainties, dependency
-        )
-        # Add to the computed dataframe
-        computed_df[f'{result_name} (UNITS)']  = values
-        computed_df[f'δ{result_name}'] = uncertainties
-        computed_df[f'{result_name}'] = rounder(values, uncertainties)
+    # Split equations into left and right sides
+    result_names, expressions = [], []
+    for equation in equations:
+        result_name, expression = equation.split('=')
+        result_names.append(result_name.strip())
+        expressions.append(expression.strip())
+
+    # Input arrays, converted once for all the formulas
+    values = [np.asarray(x, dtype=float) for x in data_values]
+    uncertainties = [
+        δx if isinstance(δx, (int, float)) else np.asarray(δx, dtype=float)
+        for δx in data_uncertainties
+        ]
     
+    # Calculate values with uncertainty propagation, in a single pass
+    compiled = get_cached_equations(variables, expressions, dependencies, result_names)
+    results = compiled(values, uncertainties, backend)
+    if budget:
+        # Contributions of each variable, from the shared jacobian kernel
+        _, contributions, shares = compiled.budget(values, uncertainties)
+
+    columns = {}
+    rounding = {}
+    summary_data = []
+    N = len(dataframe)
+
+    for i, (result_name, (result, uncertainty)) in enumerate(zip(result_names, results)):
+        # Constant formulas or uncertainties are returned as scalars
+        result = np.broadcast_to(result, N)
+        uncertainty = np.broadcast_to(uncertainty, N)
+
+        columns[f'{result_name} (UNITS)'] = result
+        columns[f'δ{result_name}'] = uncertainty
+        if numeric:
+            # Strings are only built for display, by format_rounded (the
+            # rounding follows the rows through slicing & sorting)
+            rounding[f'{result_name} (UNITS)'] = (f'δ{result_name}', result_name)
+        else:
+            # Propagated uncertainties are never negative, no need to check them
+            columns[f'{result_name}'] = rounder(result, uncertainty, check=False)
+        if budget:
+            for k, variable in enumerate(compiled.variables):
+                columns[f'δ{result_name}[{variable}]'] = np.broadcast_to(contributions[i, k], N)
+                columns[f'δ{result_name}[{variable}] (%)'] = np.broadcast_to(shares[i, k], N)
         
         # Calculate mean and relative uncertainty for the summary
-        mean_stats = calculate_statistics(result_name, values, uncertainties)
-        mean_df = pd.DataFrame(mean_stats)
-        
-        # Add LaTeX formulas
-        latex_df = pd.DataFrame({'LaTeX Formulas': latex_formulas})
+        mean_stats = calculate_statistics(result_name, result, uncertainty, check=False)
+        summary_df = pd.DataFrame(mean_stats)
         
-        # Combine mean stats and LaTeX formulas
-        summary_df = pd.concat([mean_df, latex_df], axis='columns')
+        if latex:
+            # Add LaTeX formulas (built only once per formula)
+            formula = compiled.formulas[i]
+            latex_df = pd.DataFrame({'LaTeX Formulas': formula.latex(result_name)})
+            summary_df = pd.concat([summary_df, latex_df], axis='columns')
+        if budget:
+            # Budget of the mean's uncertainty, √(Σ contribution²)/N per variable
+            mean_contributions = np.sqrt(np.sum(
+                np.broadcast_to(contributions[i], (len(compiled.variables), N))**2, axis=1
+                )) / N
+            mean_shares = budget_shares(mean_contributions, dependencies[i])
+            budget_df = pd.DataFrame({'Uncertainty Budget': [
+                f'{variable}: {share:.2f} %'
+                for variable, share in zip(compiled.variables, mean_shares)
+                ]})
+            summary_df = pd.concat([summary_df, budget_df], axis='columns')
         summary_data.append(summary_df)
+
+    if covariance and len(result_names) > 1:
+        # First-order uncorrelated covariance, consistent with the δ columns
+        # of the uncorrelated dependencies only
+        uncorrelated = [d in ('Independent', 'Covariance') for d in dependencies]
+        if not all(uncorrelated):
+            warnings.warn(
+                "The covariance is only given between 'Independent' results, "
+                "skipping: " + ', '.join(
+                    name for name, u in zip(result_names, uncorrelated) if not u
+                    )
+                )
+        # Covariance of all the results from their stacked jacobians, (N, M, M)
+        _, covariances = compiled.covariance(values, uncertainties)
+        covariances = np.broadcast_to(covariances, (N, *covariances.shape[-2:]))
+        for i, j in zip(*np.triu_indices(len(result_names), k=1)):
+            if uncorrelated[i] and uncorrelated[j]:
+                columns[f'cov({result_names[i]}, {result_names[j]})'] = covariances[:, i, j]
     
+    # Add all the results to the computed dataframe at once
+    results_df = pd.DataFrame(columns, index=dataframe.index)
+    computed_df = pd.concat(
+        [dataframe.drop(columns=results_df.columns, errors='ignore'), results_df],
+        axis='columns'
+        )
+    if numeric:
+        computed_df.attrs['rounding'] = rounding
+
     # Combine all summary dataframes
     summary_df = pd.concat(summary_data, axis='index')
     
     return computed_df, summary_df
 
-sheet_names = ['Computed table', 'Summary']
\ No newline at end of file
+
+def format_rounded(dataframe, notation='standard'):
+    """
+    Add the 'value ± uncertainty' string columns of the results computed
+    with numeric=True, rounded from their value & uncertainty columns (so
+    any rows of the computed dataframe, sliced or sorted, can be formatted).
+    
+    Parameters:
+        - dataframe : pandas.DataFrame
+            Computed dataframe (or rows of it), with the 'rounding' attribute
+        - notation : str
+            'standard' or 'sci' for scientific notation
+    
+    Returns:
+        - pandas.DataFrame : copy of the dataframe with the string columns
+    """
+    columns = {}
+    for value_column, (uncertainty_column, name) in (
+            dataframe.attrs.get('rounding', {}).items()
+            ):
+        values = dataframe[value_column].to_numpy(dtype=float)
+        uncertainties = dataframe[uncertainty_column].to_numpy(dtype=float)
+        strings = format_with_uncertainty(
+            *round_numeric(values, uncertainties, check=False), notation
+            )
+        strings[np.isnan(values) | np.isnan(uncertainties)] = 'nan ± nan'
+        columns[name] = strings
+    return dataframe.assign(**columns)
+
+sheet_names = ['Computed table', 'Summary']
@@ -1,5 +1,8 @@
 from .exports import unload_excel, unload_csv
 from .imports import load_excel, load_csv
 
-from .extract_data import load_experimental_data, get_excel_data_and_uncertainties
+from .extract_data import (
+    load_experimental_data, get_excel_data_and_uncertainties, get_uncertain_arrays
+    )
+from .uncertain_table import UncertainTable
 from .path_utils import PROJECT_DIR, DATA_DIR, get_folder_path, get_file_path, ensure_directory
\ No newline at end of file
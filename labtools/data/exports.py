@@ -5,6 +5,7 @@ Created on Mon Jun 22 21:02:09 2020
 @author: Jorge Pottiez
 """
 
+import numpy as np
 import pandas as pd
 
 from openpyxl import load_workbook
@@ -12,21 +13,26 @@ from openpyxl.utils import get_column_letter
 from openpyxl.styles import Alignment
 
 from .path_utils import get_file_path
+from ..uncertainties.format_round import round_numeric
+from .uncertain_table import UncertainTable
+from ..uncertainties.uncertain_array import UncertainArray
 
 def unload_excel(filename, dataframes, sheet_names=None, directory='data', enhance=True):
     '''
     Write multiple DataFrames to an Excel file with formatting enhancement.
     
     Parameters:
-        - dataframes : list of pandas.DataFrame, data to write
+        - dataframes : list of pandas.DataFrame, UncertainTable, UncertainArray or
+            dict {name: UncertainArray}, data to write (see _as_dataframe)
         - filename : str, Excel filename (without .xlsx extension)
         - sheet_names : list of str, optional, names of the sheets (default: None, will use Sheet1, Sheet2, etc.)
         - directory : str, optional, directory path (default: module's RESULTS_DIR)
     Returns:
         - str, full file path of the written Excel file
     '''
-    if isinstance(dataframes, pd.DataFrame):
+    if isinstance(dataframes, (pd.DataFrame, UncertainTable, UncertainArray, dict)):
         dataframes = [dataframes]
+    dataframes = [_as_dataframe(df) for df in dataframes]
     
     if sheet_names is None:
         n_dfs = len(dataframes)
@@ -38,7 +44,9 @@ def unload_excel(filename, dataframes, sheet_names=None, directory='data', enhan
     # Use context manager to handle closing automatically
     with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
         for dataframe, sheet_name in zip(dataframes, sheet_names):
+            dataframe, decimals = _round_numbers(dataframe)
             dataframe.to_excel(writer, sheet_name=sheet_name, index=False)
+            _format_rounded_numbers(writer, sheet_name, dataframe, decimals)
     
     if enhance:
         _enhance_excel(file_path)
@@ -49,7 +57,18 @@ def unload_csv(filename, dataframes, delimiter=',', directory='results'):
     '''
     Write multiple DataFrames to a CSV file.
 
+    Parameters:
+        - filename : str, CSV filename (without .csv extension)
+        - dataframes : list of pandas.DataFrame, UncertainTable, UncertainArray or
+            dict {name: UncertainArray}, data to write (see _as_dataframe)
+        - delimiter : str, optional, column separator
+        - directory : str, optional, directory path
+    Returns:
+        - str, full file path of the written CSV file
     '''
+    if isinstance(dataframes, (pd.DataFrame, UncertainTable, UncertainArray, dict)):
+        dataframes = [dataframes]
+    dataframes = [_as_dataframe(df) for df in dataframes]
 
     file_path = get_file_path(filename, extension='.csv', directory=directory)
 
@@ -73,6 +92,89 @@ def unload_csv(filename, dataframes, delimiter=',', directory='results'):
     
     return file_path
 
+def _as_dataframe(data):
+    '''
+    DataFrame of the data to write, with headers readable by
+    get_excel_data_and_uncertainties.
+
+    Parameters:
+        - data : pandas.DataFrame, UncertainTable, UncertainArray (written as
+            the magnitude 'x') or dict {name: UncertainArray or array-like}
+    Returns:
+        - pandas.DataFrame
+    '''
+    if isinstance(data, UncertainTable):
+        return data.to_dataframe()
+    elif isinstance(data, UncertainArray):
+        return data.to_frame('x')
+    elif isinstance(data, dict):
+        return pd.concat([
+            array.to_frame(name) if isinstance(array, UncertainArray)
+            else pd.DataFrame({name: np.asarray(array)})
+            for name, array in data.items()
+            ], axis='columns')
+    return data
+
+def _round_numbers(dataframe):
+    '''
+    Round the results computed with numeric rounding (listed in
+    dataframe.attrs['rounding']) to the decimal places of their uncertainties.
+
+    Parameters:
+        - dataframe : pandas.DataFrame, dataframe to write
+    Returns:
+        - pandas.DataFrame, copy of the dataframe with the rounded results
+            (the dataframe itself if it has none)
+        - dict, decimal places (array of int) of each rounded column
+    '''
+    columns, decimals = {}, {}
+    for value_column, (uncertainty_column, _) in dataframe.attrs.get('rounding', {}).items():
+        if value_column not in dataframe.columns or uncertainty_column not in dataframe.columns:
+            continue
+        values, uncertainties, places = round_numeric(
+            dataframe[value_column].to_numpy(dtype=float),
+            dataframe[uncertainty_column].to_numpy(dtype=float),
+            check=False
+            )
+        columns[value_column], columns[uncertainty_column] = values, uncertainties
+        decimals[value_column] = decimals[uncertainty_column] = places
+    if not columns:
+        return dataframe, decimals
+    return dataframe.assign(**columns), decimals
+
+def _format_rounded_numbers(writer, sheet_name, dataframe, decimals):
+    '''
+    Give the number format of their rounding to the cells of the rounded
+    results, so Excel shows their decimal places while keeping them as
+    numbers: each column gets the format of its most common decimal places,
+    and only the cells with other decimal places are rewritten.
+
+    Parameters:
+        - writer : pandas.ExcelWriter, xlsxwriter writer
+        - sheet_name : str, name of the sheet of the dataframe
+        - dataframe : pandas.DataFrame, written (rounded) dataframe
+        - decimals : dict, decimal places (array of int) of each rounded column
+    '''
+    if not decimals or dataframe.empty:
+        return
+    worksheet = writer.sheets[sheet_name]
+    formats = {}
+    def number_format(d):
+        if d not in formats:
+            formats[d] = writer.book.add_format({'num_format': '0.' + '0'*d if d > 0 else '0'})
+        return formats[d]
+
+    for column, places in decimals.items():
+        col = dataframe.columns.get_loc(column)
+        values = dataframe[column].to_numpy(dtype=float)
+        places = np.maximum(places, 0)
+        # Default format of the column, for the cells written by to_excel
+        distinct, counts = np.unique(places, return_counts=True)
+        default = int(distinct[np.argmax(counts)])
+        worksheet.set_column(col, col, None, number_format(default))
+        for row in np.flatnonzero((places != default) & np.isfinite(values)).tolist():
+            worksheet.write_number(row + 1, col, values[row], number_format(int(places[row])))
+
 def _enhance_excel(file_path):
     '''
     Enhances the Excel file by:
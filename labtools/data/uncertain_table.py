@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar container of magnitudes with their uncertainties.
+
+The headers of a table are parsed once: the values of every magnitude are
+stored as rows of a single float array, as are the non-constant uncertainties,
+while constant uncertainties (given in the header) are kept as floats.
+Magnitudes are handed out as views, without copying their data.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from ..uncertainties.uncertain_array import UncertainArray
+
+# Number in a header, taken as the constant uncertainty of the magnitude
+NUMBER_PATTERN = r'[-+]?\d*\.\d+|\d+'
+# Checks of UncertainTable.validate
+VALIDATION_CHECKS = (
+    'nan_value', 'inf_value',
+    'nan_uncertainty', 'inf_uncertainty', 'negative_uncertainty', 'zero_uncertainty',
+)
+
+class UncertainTable:
+    '''
+    Values, uncertainties and units of the magnitudes of a table.
+
+    Attributes:
+        - magnitudes: tuple of str, magnitude names (in order)
+        - units: dict, {magnitude: units}
+        - constant: dict, {magnitude: bool}, whether the uncertainty is constant
+        - assumed: frozenset of str, magnitudes without uncertainty column,
+            whose uncertainty is assumed to be zero
+        - other: dict, {header: array}, columns that aren't magnitudes
+            (e.g. labels), kept to be written back by to_dataframe
+    '''
+    def __init__(self, values, uncertainties, units=None, assumed=(), other=None):
+        '''
+        Parameters:
+            - values: dict, {magnitude: array-like}, values of each magnitude
+            - uncertainties: dict, {magnitude: array-like or float}, uncertainties
+                of each magnitude, floats for constant uncertainties
+            - units: dict, optional, {magnitude: units}
+            - assumed: iterable of str, optional, magnitudes whose (zero)
+                uncertainty was assumed, not measured
+            - other: dict, optional, {header: array-like}, other columns
+        '''
+        self.magnitudes = tuple(values)
+        self.assumed = frozenset(assumed)
+        self.other = {header: np.asarray(column) for header, column in (other or {}).items()}
+        self.units = {m: (units or {}).get(m, '') for m in self.magnitudes}
+        self.constant = {
+            m: isinstance(uncertainties[m], (int, float)) for m in self.magnitudes
+            }
+        variable = [m for m in self.magnitudes if not self.constant[m]]
+
+        # Contiguous blocks, one row per magnitude
+        self._values = np.array([values[m] for m in self.magnitudes], dtype=float, ndmin=2)
+        self._uncertainties = np.array(
+            [uncertainties[m] for m in variable], dtype=float
+            ).reshape(len(variable), self._values.shape[1])
+        self._rows = {m: i for i, m in enumerate(self.magnitudes)}
+        self._uncertainty_rows = {m: i for i, m in enumerate(variable)}
+        self._constants = {
+            m: float(uncertainties[m]) for m in self.magnitudes if self.constant[m]
+            }
+
+    @classmethod
+    def from_dataframe(cls, dataframe):
+        '''
+        Parse the headers of a dataframe into a table.
+        Assumptions (see parse_header):
+            - Magnitude columns have a '(', since the units are written in parenthesis
+            - If there's a number in the parenthesis, it's the constant uncertainty
+            - Else, the uncertainty is in the column named 'δ{magnitude}'
+        The columns that aren't magnitudes or uncertainties (non-numeric
+        columns, labels...) are kept apart, in other.
+
+        Parameters:
+            - dataframe: pd.DataFrame, data with headers like 'x (s)' or 'x (0.1 s)'
+        Returns:
+            - UncertainTable
+        '''
+        # Uncertainty columns, with possible spaces removed from the header
+        plain_headers = {
+            str(header).replace(' ', ''): header
+            for header in dataframe.columns if '(' not in str(header)
+            }
+
+        values, uncertainties, units = {}, {}, {}
+        assumed, used = [], set()
+        for header in dataframe.columns:
+            if '(' not in str(header):
+                continue
+            magnitude, uncert, unit = parse_header(header)
+            # Duplicated magnitudes: the first column is used
+            if magnitude in values or magnitude.startswith('δ'):
+                continue
+            try:
+                values[magnitude] = np.asarray(dataframe[header], dtype=float)
+            except (TypeError, ValueError):
+                continue
+            units[magnitude] = unit
+            used.add(header)
+
+            if uncert == 'not_const':
+                if 'δ' + magnitude in plain_headers:
+                    used.add(plain_headers['δ' + magnitude])
+                    uncert = dataframe[plain_headers['δ' + magnitude]]
+                else:
+                    print(
+                        f'The uncertainty column δ{magnitude} was not found',
+                        f'Assuming δ{magnitude} = 0'
+                    )
+                    uncert = 0.0
+                    assumed.append(magnitude)
+            uncertainties[magnitude] = uncert
+
+        other = {
+            header: dataframe[header].to_numpy()
+            for header in dataframe.columns if header not in used
+            }
+        return cls(values, uncertainties, units, assumed, other)
+
+    def __len__(self):
+        return self._values.shape[1]
+
+    def __contains__(self, magnitude):
+        return magnitude in self._rows
+
+    def __repr__(self):
+        return f'UncertainTable(magnitudes={self.magnitudes}, rows={len(self)})'
+
+    def value(self, magnitude):
+        '''Values of a magnitude (view)'''
+        if magnitude not in self._rows:
+            raise KeyError(
+                f"Variable '{magnitude}' not found in the table magnitudes: {list(self.magnitudes)}"
+            )
+        return self._values[self._rows[magnitude]]
+
+    def uncertainty(self, magnitude):
+        '''Uncertainties of a magnitude (view), a float if it is constant'''
+        if magnitude in self._constants:
+            return self._constants[magnitude]
+        elif magnitude in self._uncertainty_rows:
+            return self._uncertainties[self._uncertainty_rows[magnitude]]
+        raise KeyError(f"Uncertainty for variable '{magnitude}' not found")
+
+    def __getitem__(self, magnitude):
+        '''Values and uncertainties of a magnitude, as an UncertainArray (views)'''
+        return UncertainArray(self.value(magnitude), self.uncertainty(magnitude))
+
+    def get(self, variables_str):
+        '''
+        Values and uncertainties of several magnitudes (views).
+
+        Parameters:
+            - variables_str: str, magnitudes separated by commas
+        Returns:
+            - values: list of arrays, in the order of the variables' string
+            - uncertainties: list of arrays or floats (constant uncertainties)
+        '''
+        variables = [v.strip() for v in variables_str.split(',')]
+        values = [self.value(v) for v in variables]
+        uncertainties = [self.uncertainty(v) for v in variables]
+        return values, uncertainties
+
+    def validate(self):
+        '''
+        Check all the values and uncertainties at once (vectorized over the
+        stored blocks), so that later computations needn't check each element.
+        Assumed zero uncertainties (magnitudes without uncertainty column)
+        aren't flagged, they are listed apart.
+
+        Returns:
+            - dict :
+                - masks : dict, {check: bool array (K, N)}, one row per magnitude
+                    (see VALIDATION_CHECKS)
+                - counts : pd.DataFrame, number of flagged rows per magnitude & check
+                - rows : bool array (N,), rows with any flagged value or uncertainty
+                - valid : bool, whether nothing was flagged
+                - assumed : tuple of str, magnitudes with assumed zero uncertainties
+        '''
+        values = self._values
+        masks = {
+            'nan_value': np.isnan(values),
+            'inf_value': np.isinf(values),
+            }
+
+        # Non-constant uncertainties from their block, constant ones once each
+        checks = {
+            'nan_uncertainty': np.isnan,
+            'inf_uncertainty': np.isinf,
+            'negative_uncertainty': lambda δx: δx < 0,
+            'zero_uncertainty': lambda δx: δx == 0,
+            }
+        rows = [self._rows[m] for m in self._uncertainty_rows]
+        for check, flag in checks.items():
+            mask = np.zeros(values.shape, dtype=bool)
+            mask[rows] = flag(self._uncertainties)
+            for magnitude, δx in self._constants.items():
+                mask[self._rows[magnitude]] = flag(δx)
+            masks[check] = mask
+        # Exact magnitudes (no uncertainty column) aren't invalid
+        masks['zero_uncertainty'][[self._rows[m] for m in self.assumed]] = False
+
+        counts = pd.DataFrame(
+            {check: mask.sum(axis=1) for check, mask in masks.items()},
+            index=pd.Index(self.magnitudes, name='Magnitude')
+            )
+        flagged = np.any([mask.any(axis=0) for mask in masks.values()], axis=0)
+        return {
+            'masks': masks,
+            'counts': counts,
+            'rows': flagged,
+            'valid': not flagged.any(),
+            'assumed': tuple(m for m in self.magnitudes if m in self.assumed),
+            }
+
+    def to_dataframe(self):
+        '''
+        DataFrame of the table, with headers readable by from_dataframe:
+        'x (units)' and 'δx' columns, 'x (uncertainty units)' for
+        constant uncertainties, or only 'x (units)' for assumed ones.
+        The other columns follow the magnitudes.
+
+        Returns:
+            - pd.DataFrame
+        '''
+        columns = {}
+        for magnitude in self.magnitudes:
+            units = self.units[magnitude]
+            if magnitude in self.assumed:
+                # Without uncertainty, as read
+                columns[f'{magnitude} ({units})'] = self.value(magnitude)
+            elif self.constant[magnitude]:
+                header = f'{self._constants[magnitude]:g} {units}'.strip()
+                columns[f'{magnitude} ({header})'] = self.value(magnitude)
+            else:
+                columns[f'{magnitude} ({units})'] = self.value(magnitude)
+                columns[f'δ{magnitude}'] = self.uncertainty(magnitude)
+        columns.update(self.other)
+        return pd.DataFrame(columns)
+
+def parse_header(header):
+    '''
+    Extracts the magnitude, uncertainty and units from a header of a dataframe
+    Assumptions:
+        - Magnitude column have a '(', since the units are written in parenthesis
+        - If there's a number in the parenthesis, it's the constant uncertainty
+        - Else, we assume the uncertainty isn't constant.
+        - Uncertainty columns are named like 'δ{magnitude}'
+
+    Parameters:
+        - header: str, header of the dataframe
+    Returns:
+        - magnitude: str
+        - uncert: float or 'not_const'
+        - units: str
+    '''
+    magnitude, remnant = header.split('(')
+    magnitude = magnitude.replace(' ', '')
+    remnant = remnant.replace(')', '').strip()
+
+    # if inverse units are written like '1/s',
+    # it gave an error detecting it as an uncertainty
+    searched = remnant.replace(' ', '').replace('1/', '')
+
+    # Extract uncertainties from the remnant string (regular expression)
+    uncert_values = re.findall(NUMBER_PATTERN, searched)
+    # If they are uncerts with a coma decimal separator: r'[-+]?\d*\.|\,\d+|\d+'
+
+    if len(uncert_values) == 1:
+        # uncert_str_arr: list with one single element
+        uncert = float(uncert_values[0])
+        units = remnant.replace(uncert_values[0], '', 1).strip(' ,;')
+    elif len(uncert_values) == 0:
+        uncert = 'not_const'
+        units = remnant
+    else:
+        raise ValueError(
+            f'Found several uncertainties {uncert_values}'
+            + f'for the magnitude {magnitude}')
+
+    return magnitude, uncert, units
@@ -39,6 +39,10 @@ class LabTools:
         # Data storage
         self.unprocessed_data   = None
         self.processed_data     = None
+        # Parsed magnitudes of the unprocessed data (extracted data are views of it)
+        self.table              = None
+        # Validation report of the table (see UncertainTable.validate)
+        self.validation         = None
 
         if x_label is not None and y_label is not None:
             self.extracted_data = {
@@ -101,6 +105,14 @@ class LabTools:
         else:
             raise ValueError(f"Unsupported file type: {extension}")
         self.unprocessed_data = df
+        # Headers parsed once, for extraction, formulas and plots
+        self.table = data.UncertainTable.from_dataframe(df)
+        # Values & uncertainties checked once, for all the later computations
+        self.validation = self.table.validate()
+        if not self.validation['valid']:
+            counts = self.validation['counts']
+            print('Invalid data found (number of rows per magnitude):')
+            print(counts.loc[counts.any(axis=1), counts.any(axis=0)].to_string())
 
         # If specific columns are requested, extract them with uncertainties
         if self.x_label and self.y_label:
@@ -110,8 +122,8 @@ class LabTools:
                 self.x_magnitude = self.x_magnitude.replace('$','')
                 self.y_magnitude = self.y_magnitude.replace('$','')
             
-            (x, y), (x_err, y_err) = data.get_excel_data_and_uncertainties(
-                f"{self.x_magnitude},{self.y_magnitude}", df
+            (x, y), (x_err, y_err) = self.table.get(
+                f"{self.x_magnitude},{self.y_magnitude}"
                 )
             self.extracted_data = {
                 'x': x,
@@ -121,7 +133,7 @@ class LabTools:
             }
         
         else:
-            values, uncertainties = data.get_excel_data_and_uncertainties(self.variables,df)
+            values, uncertainties = self.table.get(self.variables)
             self.extracted_data = {
                 'values': values,
                 'uncertainties': uncertainties
@@ -167,6 +179,15 @@ class LabTools:
         
         return self.results_path
     
+    @property
+    def validated(self):
+        """
+        Whether the loaded table passed the validation stage (see load_data):
+        the analysis methods then skip their own checks of the data extracted
+        from it. Values passed by the caller are always checked.
+        """
+        return self.validation is not None and self.validation['valid']
+    
     # =========================================================================
     # ANALYSIS METHODS
     # =========================================================================
@@ -180,7 +201,7 @@ class LabTools:
         """
         vals = self.extracted_data
         self.regression_results =  analysis.linear_regression(
-            vals['x'], vals['y'], vals['x_err'], vals['y_err']
+            vals['x'], vals['y'], vals['x_err'], vals['y_err'], check=not self.validated
         )
         
         self.regression_results['formula'] = analysis.linear_format_formula(
@@ -201,7 +222,8 @@ class LabTools:
         """
         vals = self.extracted_data
         self.regression_results = analysis.polynomial_regression(
-            vals['x'], vals['y'], vals['x_err'], vals['y_err'], degree
+            vals['x'], vals['y'], vals['x_err'], vals['y_err'], degree,
+            check=not self.validated
         )
         self.regression_results['formula'] = analysis.polynomial_format_formula(
             self.regression_results['coefficients'],
@@ -224,7 +246,7 @@ class LabTools:
         vals = self.extracted_data
         self.regression_results = analysis.curve_regression(
             vals['x'], vals['y'], vals['x_err'], vals['y_err'],
-            function, initial_params, fit_type
+            function, initial_params, fit_type, check=not self.validated
         )
         self.regression_results['formula'] = None
         # analysis.curve_format_formula(
@@ -235,13 +257,24 @@ class LabTools:
 
         print(self.regression_results)
     
-    def apply_formula(self, dependency='Independent'):
+    def apply_formula(
+            self, dependency='Independent', backend='auto', latex=True,
+            covariance=False, budget=False, numeric=False
+            ):
         """
         Apply multiple formulas to the loaded data and calculate values with uncertainties.
         
         Parameters:
             equations (str, list): List of formula equations or comma-separated equations
             dependency (str, list): 'Dependent' or 'Independent' variables
+            backend (str): Numeric backend ('numpy', 'numexpr', 'math' or 'auto')
+            latex (bool): Whether to add the LaTeX formulas to the summary
+            covariance (bool): Whether to add the covariance between each
+                pair of results as 'cov(a, b)' columns
+            budget (bool): Whether to add the contribution of each variable
+                to the uncertainty of each result
+            numeric (bool): Whether to keep the results as numbers, without the
+                'value ± uncertainty' columns (see analysis.format_rounded)
                 
         Returns:
             tuple: (computed_dataframe, summary_dataframe)
@@ -254,7 +287,13 @@ class LabTools:
             self.unprocessed_data, 
             self.variables, 
             self.equations, 
-            dependency
+            dependency,
+            backend,
+            latex,
+            table=self.table,
+            covariance=covariance,
+            budget=budget,
+            numeric=numeric
         )
         
         # Store the computed data
@@ -360,36 +399,72 @@ class LabTools:
     # UTILITY METHODS
     # =========================================================================
 
-    def propagate_uncertainty(self, values, uncerts, dependency='Independent'):
+    def propagate_uncertainty(
+            self, values, uncerts, dependency='Independent', covariance=None,
+            engine='symbolic', backend='auto'
+            ):
         """
         Calculate results with uncertainty propagation.
+        Scalar measurements (a float, or a float per variable) take a cached
+        fast path and return plain floats.
         
         Parameters:
-            dependency (str): 'Dependent' or 'Independent' variables
+            dependency (str): 'Dependent', 'Independent' or 'Covariance' variables,
+                or 'SecondOrder' for a bias-corrected second-order propagation
+            covariance (array-like): Covariance matrix of the variables (for 'Covariance')
+            engine (str): 'symbolic' (sympy) or 'autodiff' (no sympy) derivatives
+            backend (str): Numeric backend ('numpy', 'numexpr', 'math' or 'auto')
             
         Returns:
             tuple: Result values and uncertainties
         """
+        expression = self._get_expression()
         
-        if '=' in self.equation:
-            _, expression = self.equation.replace(' ', '').split('=')
-        else:
-            expression = self.equation
-
-        # Access dictionary values properly instead of unpacking
+        is_scalar = lambda x: isinstance(x, (int, float))
+        scalar_values = is_scalar(values) or (
+            isinstance(values, (list, tuple)) and all(is_scalar(x) for x in values)
+            )
         
-        if isinstance(values, (int, float)):
-            values = [[values]]
-            uncerts = [[uncerts]]
-            result, uncertainty = uncertainties.propagate_uncertainty(
+        if (
+            scalar_values and engine == 'symbolic' and covariance is None
+            and backend in ('auto', 'math')
+            ):
+            return uncertainties.propagate_scalar(
                 self.variables, expression, values, uncerts, dependency
                 )
-            # return result[0], uncertainty[0]
-            return result, uncertainty
+        
+        if is_scalar(values):
+            values = [values]
+            uncerts = [uncerts]
+        return uncertainties.propagate_uncertainty(
+            self.variables, expression, values, uncerts, dependency, covariance,
+            engine=engine, backend=backend
+            )
+    
+    def propagate_uncertainty_batch(self, measurements, dependency='Independent'):
+        """
+        Calculate results with uncertainty propagation for a list of
+        measurements, in a single vectorized call.
+        
+        Parameters:
+            measurements (list): (values, uncertainties) tuples, with a float
+                (or a float per variable) each
+            dependency (str): 'Dependent', 'Independent', 'Covariance' or 'SecondOrder'
+            
+        Returns:
+            list: (result, uncertainty) tuples of floats
+        """
+        return uncertainties.propagate_batch(
+            self.variables, self._get_expression(), measurements, dependency
+            )
+    
+    def _get_expression(self):
+        """Right-hand side of the equation"""
+        if '=' in self.equation:
+            _, expression = self.equation.replace(' ', '').split('=')
         else:
-            return uncertainties.propagate_uncertainty(
-                self.variables, expression, values, uncerts, dependency
-                )
+            expression = self.equation
+        return expression
     
     def get_latex_equations(self, dependency='Independent', print_latex=False):
         """
@@ -431,6 +506,8 @@ class LabTools:
         # Clear large data structures
         self.unprocessed_data = None
         self.processed_data = None
+        self.table = None
+        self.validation = None
         self.extracted_data = None
         self.regression_results = None
         
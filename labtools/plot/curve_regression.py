@@ -1,5 +1,6 @@
 import numpy as np
 
+from ..uncertainties import split_uncertain
 from .utils import setup_plot, plot_data_with_errors, plot_prediction_and_uncertainty, save_figure
 
 def plot_curve_regression(
@@ -13,12 +14,16 @@ def plot_curve_regression(
 
     Parameters:
         - x, y, δx, δy: array-like, data and uncertainties
+            (δx, δy are taken from x, y if they are UncertainArray and δx, δy are None)
         - curve_results: dict, curve regression data
         - x_label, y_label, title: str, plot's info
         - save: bool, whether to save the plot
     Returns:
         - fig, ax: matplotlib's figure and axis objects
     """
+    x, δx = split_uncertain(x, δx)
+    y, δy = split_uncertain(y, δy)
+
     params = curve_results['parameters']
     errors = curve_results['errors']
     function = curve_results['function']
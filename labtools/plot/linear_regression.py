@@ -1,5 +1,6 @@
 import numpy as np
 
+from ..uncertainties import split_uncertain
 from .utils import setup_plot, plot_data_with_errors, plot_prediction_and_uncertainty, save_figure
 
 def plot_linear_regression(
@@ -13,12 +14,16 @@ def plot_linear_regression(
     
     Parameters:
         - x, y, δx, δy: array-like, data and uncertainties
+            (δx, δy are taken from x, y if they are UncertainArray and δx, δy are None)
         - regression_results: dict, linear regression data
         - x_label, y_label, title: str, plot's info
         - save: bool, whether to save the plot and its data
     Returns:
         - fig, ax: matplotlib's figure and axis objects
     """
+    x, δx = split_uncertain(x, δx)
+    y, δy = split_uncertain(y, δy)
+
     A, B = regression_results['coefficients']
     δA, δB = regression_results['errors']
     r = regression_results['r']
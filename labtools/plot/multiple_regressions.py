@@ -3,6 +3,7 @@ import matplotlib.cm as cm
 import matplotlib.lines as mlines
 import matplotlib.patches as mpatches
 
+from ..uncertainties import split_uncertain
 from .utils import setup_plot, plot_data_with_errors, plot_prediction_and_uncertainty, save_figure
 
 def plot_multiple_regressions(
@@ -16,6 +17,7 @@ def plot_multiple_regressions(
     
     Parameters:
         - datasets: (x, y, δx, δy), data and uncertainties
+            (x, y can be UncertainArray, with δx, δy None)
         - regression_results: dict, regression data (linear, polynomial, curve)
         - labels: str, labels for each regression
         - x_label, y_label, title: str, plot's info
@@ -46,6 +48,8 @@ def plot_multiple_regressions(
         zip(datasets, regression_results, labels)
         ):
         x, y, δx, δy = dataset
+        x, δx = split_uncertain(x, δx)
+        y, δy = split_uncertain(y, δy)
         
         plot_data_with_errors
         ax.errorbar(
@@ -1,2 +1,19 @@
 from .format_round import round_with_uncertainty, rounder, isiterable
-from .propagation import propagate_uncertainty, get_latex_equations
\ No newline at end of file
+from .propagation import (
+    propagate_uncertainty, propagate_scalar, propagate_batch,
+    get_uncertainty_budget, get_latex_equations
+    )
+from .autodiff import AutodiffFormula, get_autodiff_formula
+from .numerical import propagate_callable
+from .uncertain_array import UncertainArray, split_uncertain
+from .kernel_cache import enable_kernel_cache, disable_kernel_cache, kernel_cache_directory
+
+def __getattr__(name):
+    # The symbolic engine imports sympy, so it is only loaded when requested
+    if name in (
+            'CompiledFormula', 'get_compiled_formula',
+            'CompiledEquations', 'get_compiled_equations', 'clear_formula_cache'
+            ):
+        from . import compiled
+        return getattr(compiled, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
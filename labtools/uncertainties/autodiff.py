@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+Forward-mode automatic differentiation for uncertainty propagation.
+
+The expression string is parsed once into a Python code object, which is
+evaluated on dual numbers: arrays carrying their values plus the partial
+derivatives with respect to every variable. The value and the whole gradient
+are obtained in a single forward sweep, without sympy.
+"""
+import ast
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+
+from .utils.arrays import as_arrays
+from .utils.covariance import contract_covariance, uncorrelated_variance
+from .utils.errors import UncertaintyError
+
+# Maximum number of parsed formulas kept in memory
+CACHE_SIZE = 128
+
+class Dual:
+    '''
+    Dual number: value(s) and partial derivatives of a quantity.
+
+    Attributes:
+        - value: float or array, value(s) of the quantity
+        - partials: dict, {variable index: derivative}, variables whose
+            derivative is zero are left out
+    '''
+    __slots__ = ('value', 'partials')
+    # Make numpy defer to the reflected operators of Dual
+    __array_ufunc__ = None
+
+    def __init__(self, value, partials):
+        self.value = value
+        self.partials = partials
+
+    def chain(self, value, derivative):
+        '''Dual of f(self), given f(self.value) and f'(self.value)'''
+        return Dual(value, {i: derivative*d for i, d in self.partials.items()})
+
+    def __add__(self, other):
+        if not isinstance(other, Dual):
+            return Dual(self.value + other, self.partials)
+        partials = dict(self.partials)
+        for i, d in other.partials.items():
+            partials[i] = partials[i] + d if i in partials else d
+        return Dual(self.value + other.value, partials)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return Dual(-self.value, {i: -d for i, d in self.partials.items()})
+
+    def __pos__(self):
+        return self
+
+    def __sub__(self, other):
+        return self + (-other)
+
+    def __rsub__(self, other):
+        return (-self) + other
+
+    def __mul__(self, other):
+        if not isinstance(other, Dual):
+            return Dual(self.value*other, {i: d*other for i, d in self.partials.items()})
+        partials = {i: d*other.value for i, d in self.partials.items()}
+        for i, d in other.partials.items():
+            partials[i] = partials[i] + self.value*d if i in partials else self.value*d
+        return Dual(self.value*other.value, partials)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if not isinstance(other, Dual):
+            return self * (1/other)
+        return self * other.reciprocal()
+
+    def __rtruediv__(self, other):
+        return self.reciprocal() * other
+
+    def reciprocal(self):
+        '''Dual of 1/self'''
+        inverse = 1/self.value
+        return self.chain(inverse, -inverse**2)
+
+    def __pow__(self, other):
+        if not isinstance(other, Dual):
+            if other == 2:
+                return self.chain(self.value**2, 2*self.value)
+            return self.chain(self.value**other, other*self.value**(other - 1))
+        # a^b = exp(b·log(a))
+        return exp(other * log(self))
+
+    def __rpow__(self, other):
+        value = other**self.value
+        return self.chain(value, value*np.log(other))
+
+def _unary(func, derivative):
+    '''
+    Make a function accept dual numbers.
+
+    Parameters:
+        - func: callable, numpy function f(x)
+        - derivative: callable, derivative f'(x, f(x))
+    Returns:
+        - callable, f for floats, arrays and dual numbers
+    '''
+    def dual_func(x):
+        if isinstance(x, Dual):
+            value = func(x.value)
+            return x.chain(value, derivative(x.value, value))
+        return func(x)
+    return dual_func
+
+exp = _unary(np.exp, lambda x, fx: fx)
+_ln = _unary(np.log, lambda x, fx: 1/x)
+
+def log(x, base=None):
+    '''Natural logarithm, or logarithm in the given base'''
+    if base is None:
+        return _ln(x)
+    return _ln(x) / _ln(base)
+
+FUNCTIONS = {
+    'exp': exp,
+    'log': log,
+    'ln': log,
+    'sqrt': _unary(np.sqrt, lambda x, fx: 0.5/fx),
+    'sin': _unary(np.sin, lambda x, fx: np.cos(x)),
+    'cos': _unary(np.cos, lambda x, fx: -np.sin(x)),
+    'tan': _unary(np.tan, lambda x, fx: 1 + fx**2),
+    'asin': _unary(np.arcsin, lambda x, fx: 1/np.sqrt(1 - x**2)),
+    'acos': _unary(np.arccos, lambda x, fx: -1/np.sqrt(1 - x**2)),
+    'atan': _unary(np.arctan, lambda x, fx: 1/(1 + x**2)),
+    'sinh': _unary(np.sinh, lambda x, fx: np.cosh(x)),
+    'cosh': _unary(np.cosh, lambda x, fx: np.sinh(x)),
+    'tanh': _unary(np.tanh, lambda x, fx: 1 - fx**2),
+    'Abs': _unary(np.abs, lambda x, fx: np.sign(x)),
+    'abs': _unary(np.abs, lambda x, fx: np.sign(x)),
+}
+
+CONSTANTS = {
+    'pi': np.pi,
+    'E': np.e,
+}
+
+# Syntax allowed in an expression
+ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Constant, ast.Load,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd,
+)
+
+def parse_expression(variables, expression_str):
+    '''
+    Parse an expression string into a code object.
+    As in sympy, '^' is taken as exponentiation.
+
+    Parameters:
+        - variables: tuple of str, variable names (NFKC normalised, as Python does)
+        - expression_str: str, formula expression without "=" sign
+    Returns:
+        - code object, to be evaluated with the variables and FUNCTIONS in scope
+    '''
+    try:
+        tree = ast.parse(expression_str.replace('^', '**'), mode='eval')
+    except SyntaxError as e:
+        raise UncertaintyError('Error in formula: ' + str(e))
+
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise UncertaintyError(
+                f'Error in formula: unsupported syntax {type(node).__name__}'
+            )
+        if isinstance(node, ast.Call) and (
+                not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS
+                or node.keywords
+                ):
+            raise UncertaintyError('Error in formula: unsupported function call')
+        if isinstance(node, ast.Name) and not (
+                node.id in variables or node.id in FUNCTIONS or node.id in CONSTANTS
+                ):
+            raise UncertaintyError(f'Error in formula: unknown name {node.id}')
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise UncertaintyError(f'Error in formula: invalid constant {node.value!r}')
+
+    return compile(tree, '<formula>', 'eval')
+
+class AutodiffFormula:
+    '''
+    Formula evaluated with forward-mode automatic differentiation.
+    Same numeric interface as CompiledFormula, without symbolic expressions.
+
+    Attributes:
+        - variables: tuple of str, variable names (in order)
+        - expression: str, formula expression without "=" sign
+        - dependency: str, dependency type ('Dependent', 'Independent' or 'Covariance')
+        - code: code object of the expression
+    '''
+    def __init__(self, variables, expression, dependency='Independent'):
+        if dependency not in ('Dependent', 'Independent', 'Covariance'):
+            raise UncertaintyError(
+                f'Invalid dependency type: {dependency}. '
+                "Must be 'Dependent', 'Independent' or 'Covariance'."
+            )
+        self.variables = tuple(variables)
+        self.expression = expression
+        self.dependency = dependency
+        # Python normalises identifiers (NFKC) when parsing
+        self._names = tuple(unicodedata.normalize('NFKC', v) for v in self.variables)
+        self.code = parse_expression(self._names, expression)
+
+    def __repr__(self):
+        return (
+            f"AutodiffFormula(variables={self.variables}, "
+            f"expression='{self.expression}', dependency='{self.dependency}')"
+            )
+
+    def _evaluate(self, arguments):
+        namespace = {**CONSTANTS, **FUNCTIONS, **dict(zip(self._names, arguments))}
+        return eval(self.code, {'__builtins__': {}}, namespace)
+
+    def formula_func(self, *values):
+        '''Evaluate the formula (without derivatives)'''
+        return self._evaluate(values)
+
+    def dual(self, values):
+        '''
+        Evaluate the formula on dual numbers, seeded with each variable.
+
+        Parameters:
+            - values: array-like, values of the variables (one subarray per variable)
+        Returns:
+            - Dual, result and its partial derivatives
+        '''
+        duals = [Dual(x, {i: 1.0}) for i, x in enumerate(as_arrays(values))]
+        result = self._evaluate(duals)
+        if not isinstance(result, Dual):
+            # Constant formula
+            result = Dual(result, {})
+        return result
+
+    def jacobian(self, values):
+        '''
+        Evaluate the formula and its gradient for all rows at once.
+
+        Parameters:
+            - values: array-like, values of the variables (one subarray per variable)
+        Returns:
+            - result: array-like, calculated result
+            - jacobian: array, partial derivatives with shape (K, ...),
+                one row per variable
+        '''
+        result = self.dual(values)
+        partials = [result.partials.get(i, 0.0) for i in range(len(self.variables))]
+        jacobian = np.array(np.broadcast_arrays(result.value, *partials)[1:], dtype=float)
+        return result.value, jacobian
+
+    def __call__(self, values, uncertainties=None, covariance=None):
+        '''
+        Evaluate the formula and its uncertainty.
+
+        Parameters:
+            - values: array-like, values of the variables (one subarray per variable)
+            - uncertainties: array-like, uncertainties of the variables
+            - covariance: array-like, optional, only for 'Covariance' dependency.
+                Covariance matrix of the variables, shared (K, K) or per row (N, K, K).
+        Returns:
+            - result: array-like, calculated result
+            - uncertainty: array-like, related uncertainty
+        '''
+        if self.dependency == 'Covariance':
+            result, jacobian = self.jacobian(values)
+            if covariance is None:
+                variance = uncorrelated_variance(jacobian, as_arrays(uncertainties))
+            else:
+                variance = contract_covariance(jacobian, covariance)
+            return result, np.sqrt(variance)
+
+        result = self.dual(values)
+        uncertainties = as_arrays(uncertainties)
+        terms = [d * uncertainties[i] for i, d in result.partials.items()]
+
+        if self.dependency == 'Dependent':
+            # Sum of absolutes
+            uncertainty = sum(np.abs(term) for term in terms)
+        else:
+            # Square root of sum of squares
+            uncertainty = np.sqrt(sum(term**2 for term in terms))
+
+        return result.value, uncertainty
+
+def get_autodiff_formula(variables_str, expression_str, dependency='Independent'):
+    '''
+    Get the autodiff formula of an expression, parsing it only
+    the first time it is requested.
+
+    Parameters:
+        - variables_str: string, variables separated by commas
+        - expression_str: string, mathematical expression without "=" sign
+        - dependency: string with the dependency type
+            ('Dependent', 'Independent' or 'Covariance')
+    Returns:
+        - AutodiffFormula
+    '''
+    variables = tuple(v.strip() for v in variables_str.split(','))
+    expression = expression_str.replace(' ', '')
+    return _parse_formula(variables, expression, dependency)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_formula(variables, expression, dependency):
+    return AutodiffFormula(variables, expression, dependency)
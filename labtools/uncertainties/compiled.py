@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled formulas for uncertainty propagation.
+
+The symbolic work (sympify, differentiation and lambdify) of a formula only
+depends on its variables, expression and dependency, so it is done once per
+process and kept in a bounded LRU cache. The generated kernels are also
+stored in the on-disk kernel cache when it is enabled (see kernel_cache).
+"""
+import re
+from functools import lru_cache
+
+from .kernel_cache import kernel_key, save_kernel, _cached_formula, _cached_equations
+from .kernels import FormulaKernels, EquationsKernels
+from .utils.errors import UncertaintyError
+from .utils.latex import latex_escape_special_characters
+from .utils.symbolic import (
+    sp, create_formula_and_gradient, combine_gradient, create_hessian, combine_second_order,
+    create_fused_function, create_system_function, create_formula_function,
+    create_jacobian_function, create_system_jacobian_function
+    )
+
+# Maximum number of compiled formulas kept in memory
+CACHE_SIZE = 128
+
+class CompiledFormula(FormulaKernels):
+    '''
+    Symbolic formula, gradient and numeric kernels of an expression.
+    LaTeX representations are only built when requested.
+
+    Attributes:
+        - variables: tuple of str, variable names (in order)
+        - expression: str, formula expression without "=" sign
+        - dependency: str, dependency type
+            ('Dependent', 'Independent', 'Covariance' or 'SecondOrder')
+        - formula_symb: symbolic expression for the formula
+        - gradient: list of symbolic partial derivatives
+        - hessian: list of lists of second partial derivatives ('SecondOrder' only)
+        - uncertainty_symbols: list of uncertainty symbols (δx, δy, ...)
+        - value_symb: symbolic expression for the returned value
+            (bias-corrected for 'SecondOrder', else the formula)
+        - uncertainty_symb: symbolic expression for the uncertainty
+        - formula_func: lambda function for the formula
+        - fused_func: lambda function returning (formula, uncertainty) in one pass
+            (None for 'Covariance', whose uncertainty needs a covariance matrix),
+            other numeric backends are built lazily by kernel()
+        - jacobian_func: lambda function returning (formula, gradient), built lazily
+
+    The expression may use previous results given by definitions, which are
+    substituted by their formulas: the gradient is then the composed Jacobian
+    with respect to the variables.
+    '''
+    def __init__(self, variables, expression, dependency='Independent', definitions=None):
+        self.variables = tuple(variables)
+        self.expression = expression
+        self.dependency = dependency
+        variables_str = ','.join(self.variables)
+        # Substituted results aren't part of the expression, so their kernels aren't stored
+        self._stored = not definitions
+
+        # Symbolic expressions
+        self.formula_symb, self.gradient, self.uncertainty_symbols = (
+            create_formula_and_gradient(variables_str, expression, definitions)
+            )
+        if dependency == 'SecondOrder':
+            # Derived once, kept with the compiled formula
+            self.hessian = create_hessian(variables_str, self.gradient)
+            self.value_symb, self.uncertainty_symb = combine_second_order(
+                self.formula_symb, self.gradient, self.hessian, self.uncertainty_symbols
+                )
+        else:
+            self.hessian = None
+            self.value_symb = self.formula_symb
+            self.uncertainty_symb = combine_gradient(
+                self.gradient, self.uncertainty_symbols, dependency
+                )
+        # Numeric kernels
+        self.formula_func = sp.lambdify(variables_str, self.formula_symb)
+        self._store('formula', self.formula_func)
+        self._kernels = {}
+        if dependency == 'Covariance':
+            self.fused_func = None
+        else:
+            self.fused_func = self.kernel('numpy')
+        self._jacobian_func = None
+        # LaTeX, built lazily per result variable
+        self._latex = {}
+
+    def kernel(self, backend='numpy'):
+        '''
+        Fused lambda function returning (formula, uncertainty),
+        built the first time each backend is requested.
+
+        Parameters:
+            - backend: str, 'numpy', 'numexpr' or 'math'
+        Returns:
+            - callable, f(*values, *uncertainties) -> (value, uncertainty)
+        '''
+        if backend not in self._kernels:
+            self._kernels[backend] = create_fused_function(
+                ','.join(self.variables), self.formula_symb, self.gradient,
+                self.uncertainty_symbols, self.dependency, backend, self.hessian
+                )
+            self._store(backend, self._kernels[backend])
+        return self._kernels[backend]
+
+    def formula_kernel(self, backend='numpy'):
+        '''
+        Lambda function of the formula alone, built the first time each
+        backend is requested ('numpy' is formula_func).
+
+        Parameters:
+            - backend: str, 'numpy', 'numexpr' or 'math'
+        Returns:
+            - callable, f(*values) -> value
+        '''
+        if backend == 'numpy':
+            return self.formula_func
+        kernel = f'formula_{backend}'
+        if kernel not in self._kernels:
+            self._kernels[kernel] = create_formula_function(
+                ','.join(self.variables), self.formula_symb, backend
+                )
+            self._store(kernel, self._kernels[kernel])
+        return self._kernels[kernel]
+
+    @property
+    def jacobian_func(self):
+        '''Lambda function returning the formula and its gradient'''
+        if self._jacobian_func is None:
+            self._jacobian_func = create_jacobian_function(
+                ','.join(self.variables), self.formula_symb, self.gradient
+                )
+            self._store('jacobian', self._jacobian_func)
+        return self._jacobian_func
+
+    def _store(self, kernel, func):
+        '''Store a kernel in the on-disk cache (if it is enabled)'''
+        if self._stored:
+            key = kernel_key(self.variables, self.expression, self.dependency, kernel)
+            save_kernel(key, kernel, func)
+
+    def __repr__(self):
+        return (
+            f"CompiledFormula(variables={self.variables}, "
+            f"expression='{self.expression}', dependency='{self.dependency}')"
+            )
+
+    def equations(self, result_variable='f'):
+        '''
+        Symbolic equations of the formula and its uncertainty.
+
+        Parameters:
+            - result_variable: str, result variable name
+        Returns:
+            - formula_eq, uncertainty_eq: sympy equations
+        '''
+        formula_eq = sp.Eq(sp.Symbol(result_variable), self.value_symb)
+        uncertainty_eq = sp.Eq(sp.Symbol('δ' + result_variable), self.uncertainty_symb)
+        return formula_eq, uncertainty_eq
+
+    def latex(self, result_variable='f'):
+        '''
+        LaTeX representations of the formula and its uncertainty,
+        with the special characters escaped.
+
+        Parameters:
+            - result_variable: str, result variable name
+        Returns:
+            - formula_latex, uncertainty_latex: str
+        '''
+        if result_variable not in self._latex:
+            formula_eq, uncertainty_eq = self.equations(result_variable)
+
+            formula_latex = latex_escape_special_characters(
+                sp.latex(formula_eq), structure=False
+                )
+            uncertainty_latex = latex_escape_special_characters(
+                sp.latex(uncertainty_eq), structure=False
+                )
+            self._latex[result_variable] = (formula_latex, uncertainty_latex)
+
+        return self._latex[result_variable]
+
+class CompiledEquations(EquationsKernels):
+    '''
+    Several formulas of the same variables evaluated by a single kernel,
+    which shares the common subexpressions of all formulas and gradients.
+
+    Expressions may use the results of other equations (e.g. 'τ_2 = -1/B',
+    'ω = 2*pi/τ_2'). They are compiled in topological order, each result
+    being substituted by its formula, so intermediate results are computed
+    once by the kernel and their uncertainties are propagated through the
+    composed Jacobian.
+
+    Attributes:
+        - variables: tuple of str, variable names (in order)
+        - expressions: tuple of str, mathematical expressions without "=" sign
+        - dependencies: tuple of str, dependency type of each expression
+        - result_names: tuple of str, result name of each expression (or None)
+        - formulas: list of CompiledFormula, one per expression
+    '''
+    def __init__(self, variables, expressions, dependencies, result_names=None):
+        self.variables = tuple(variables)
+        self.expressions = tuple(expressions)
+        self.dependencies = tuple(dependencies)
+        self.result_names = result_names
+        if result_names is None:
+            order, references = range(len(expressions)), {}
+        else:
+            order, references = sort_equations(self.variables, result_names, expressions)
+
+        formulas, definitions = {}, {}
+        for i in order:
+            if references.get(i):
+                formula = CompiledFormula(
+                    self.variables, expressions[i], dependencies[i],
+                    {name: definitions[name] for name in references[i]}
+                    )
+            else:
+                formula = _compile_formula(self.variables, expressions[i], dependencies[i])
+            formulas[i] = formula
+            if result_names is not None:
+                definitions[result_names[i]] = formula.formula_symb
+
+        self.formulas = [formulas[i] for i in range(len(expressions))]
+        self._kernels = {}
+        self._jacobian_func = None
+
+    def __repr__(self):
+        expressions = [formula.expression for formula in self.formulas]
+        return f"CompiledEquations(variables={self.variables}, expressions={expressions})"
+
+    def kernel(self, backend='numpy'):
+        '''
+        Lambda function returning (value_1, uncertainty_1, value_2, ...),
+        built the first time each backend is requested.
+        '''
+        if backend not in self._kernels:
+            # Without a covariance matrix, covariant variables are uncorrelated
+            dependencies = [
+                'Independent' if formula.dependency == 'Covariance' else formula.dependency
+                for formula in self.formulas
+                ]
+            self._kernels[backend] = create_system_function(
+                ','.join(self.variables),
+                [formula.formula_symb for formula in self.formulas],
+                [formula.gradient for formula in self.formulas],
+                self.formulas[0].uncertainty_symbols, dependencies, backend,
+                [formula.hessian for formula in self.formulas]
+                )
+            key = kernel_key(
+                self.variables, self.expressions, self.dependencies,
+                self.result_names, 'system', backend
+                )
+            save_kernel(key, backend, self._kernels[backend])
+        return self._kernels[backend]
+
+    @property
+    def jacobian_func(self):
+        '''Lambda function returning all the formulas and their gradients'''
+        if self._jacobian_func is None:
+            self._jacobian_func = create_system_jacobian_function(
+                ','.join(self.variables),
+                [formula.formula_symb for formula in self.formulas],
+                [formula.gradient for formula in self.formulas]
+                )
+            key = kernel_key(
+                self.variables, self.expressions, self.dependencies,
+                self.result_names, 'system', 'jacobian'
+                )
+            save_kernel(key, 'jacobian', self._jacobian_func)
+        return self._jacobian_func
+
+def sort_equations(variables, result_names, expressions):
+    '''
+    Sort chained equations so that every result is computed before it is used.
+
+    Parameters:
+        - variables: tuple of str, variable names, which take precedence
+            over result names
+        - result_names: list of str, result name of each expression
+        - expressions: list of str, mathematical expressions without "=" sign
+    Returns:
+        - order: list of int, expression indices in evaluation order
+        - references: dict, {index: result names used by the expression}
+    '''
+    indices = {name: i for i, name in enumerate(result_names) if name not in variables}
+    references = {
+        i: sorted(set(re.findall(r'\w+', expression)) & indices.keys())
+        for i, expression in enumerate(expressions)
+        }
+
+    # Depth-first topological sort
+    order, state = [], {}
+    def visit(i, path):
+        if state.get(i) == 'done':
+            return
+        if state.get(i) == 'visiting':
+            cycle = ' -> '.join(result_names[j] for j in path + [i])
+            raise UncertaintyError(f'Circular reference between equations: {cycle}')
+        state[i] = 'visiting'
+        for name in references[i]:
+            visit(indices[name], path + [i])
+        state[i] = 'done'
+        order.append(i)
+
+    for i in range(len(expressions)):
+        visit(i, [])
+    return order, references
+
+def get_compiled_formula(variables_str, expression_str, dependency='Independent'):
+    '''
+    Get the compiled formula of an expression, deriving it only
+    the first time it is requested.
+
+    Parameters:
+        - variables_str: string, variables separated by commas
+        - expression_str: string, mathematical expression without "=" sign
+        - dependency: string with the dependency type
+            ('Dependent', 'Independent', 'Covariance' or 'SecondOrder')
+    Returns:
+        - CompiledFormula
+    '''
+    variables = tuple(v.strip() for v in variables_str.split(','))
+    expression = expression_str.replace(' ', '')
+    return _compile_formula(variables, expression, dependency)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _compile_formula(variables, expression, dependency):
+    return CompiledFormula(variables, expression, dependency)
+
+def get_compiled_equations(variables_str, expressions, dependencies, result_names=None):
+    '''
+    Get the compiled system of several expressions of the same variables,
+    deriving it only the first time it is requested.
+
+    Parameters:
+        - variables_str: string, variables separated by commas
+        - expressions: list of str, mathematical expressions without "=" sign
+        - dependencies: list of str, dependency type of each expression
+        - result_names: list of str, optional, result name of each expression,
+            which the other expressions can use
+    Returns:
+        - CompiledEquations
+    '''
+    variables = tuple(v.strip() for v in variables_str.split(','))
+    expressions = tuple(expression.replace(' ', '') for expression in expressions)
+    if result_names is not None:
+        result_names = tuple(name.strip() for name in result_names)
+    return _compile_equations(variables, expressions, tuple(dependencies), result_names)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _compile_equations(variables, expressions, dependencies, result_names):
+    return CompiledEquations(variables, expressions, dependencies, result_names)
+
+def clear_formula_cache():
+    '''Remove every compiled formula from the (in-memory) cache.'''
+    _compile_formula.cache_clear()
+    _compile_equations.cache_clear()
+    _cached_formula.cache_clear()
+    _cached_equations.cache_clear()
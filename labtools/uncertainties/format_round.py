@@ -8,6 +8,11 @@ Created on Sat Mar  4 00:45:38 2023
 import math
 import warnings
 
+import numpy as np
+
+# Distance to a half (of the scaled value) below which np.round may differ from round
+TIE_TOLERANCE = 1e-6
+
 def round_with_uncertainty(value, uncertainty, notation='standard'):
     """
     Round a value based on its uncertainty following standard scientific rules.
@@ -24,12 +29,12 @@ def round_with_uncertainty(value, uncertainty, notation='standard'):
     if math.isnan(value) or math.isnan(uncertainty):
         return "nan ± nan"
     
-    elif uncertainty <= 0:
+    elif uncertainty < 0:
         warnings.warn("Uncertainty must be positive, using absolute value")
         uncertainty = abs(uncertainty)
     
     # Determine significant digits
-    elif uncertainty == 0:
+    if uncertainty == 0:
         sig_digits = 3  # Default if uncertainty is zero
 
     else:
@@ -66,7 +71,156 @@ def round_with_uncertainty(value, uncertainty, notation='standard'):
         return f"{val_rounded:{format_spec}} ± {unc_rounded:{format_spec}}"
 
 
-def rounder(value, uncertainty, notation='standard'):
+def rounding_decimals(uncertainty):
+    '''
+    Decimal places of the rounding of each uncertainty (vectorized), with the
+    rules of round_with_uncertainty: one significant digit, two if it is a 1,
+    and 3 decimals for zero uncertainties. Negative decimals round to tens,
+    hundreds...
+
+    Parameters:
+        - uncertainty : array-like, uncertainties (non-negative)
+    Returns:
+        - array of int : decimal places, 0 where the uncertainty isn't finite
+    '''
+    uncertainty = np.asarray(uncertainty, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        exponent = np.floor(np.log10(uncertainty))
+        first_digit = uncertainty * 10**(-exponent)
+    # Special case: if uncertainty starts with 1, use two significant digits
+    decimals = np.where((first_digit >= 1) & (first_digit < 2), 1 - exponent, -exponent)
+    decimals = np.where(uncertainty == 0, 3, decimals)
+    decimals = np.where(np.isfinite(decimals), decimals, 0)
+    return decimals.astype(int)
+
+def round_to_decimals(x, decimals):
+    '''
+    Round each value to its number of decimal places (vectorized),
+    in one pass per distinct number of decimals.
+    np.round scales by 10**d and rounds half to even, so values near a tie
+    (or too large for the scaling to be exact) are rounded again with
+    Python's (correctly rounded) round, as round_with_uncertainty does.
+
+    Parameters:
+        - x : array-like, values
+        - decimals : array-like of int, decimal places of each value
+    Returns:
+        - array : rounded values
+    '''
+    x, decimals = np.broadcast_arrays(np.asarray(x, dtype=float), decimals)
+    rounded = np.empty(x.shape)
+    for d in np.unique(decimals):
+        mask = decimals == d
+        values = x[mask]
+        rounded_values = np.round(values, d)
+        # Scaled values within rounding error of a half, or beyond 2**52
+        with np.errstate(invalid='ignore', over='ignore'):
+            scaled = np.abs(values * 10.0**d)
+            inexact = (np.abs(scaled % 1 - 0.5) < TIE_TOLERANCE) | (scaled >= 2.0**52)
+        d = int(d)
+        rounded_values[inexact] = [round(value, d) for value in values[inexact].tolist()]
+        rounded[mask] = rounded_values
+    return rounded
+
+def format_with_uncertainty(values, uncertainties, decimals, notation='standard'):
+    '''
+    Format rounded values and uncertainties as "value ± uncertainty" strings,
+    in bulk (one pass per distinct format).
+
+    Parameters:
+        - values : array, rounded values
+        - uncertainties : array, rounded uncertainties
+        - decimals : array of int, decimal places of each value
+        - notation : str, 'standard' or 'sci' for scientific notation
+    Returns:
+        - array of str : formatted strings
+    '''
+    values, uncertainties, decimals = np.broadcast_arrays(values, uncertainties, decimals)
+    exponent = np.zeros(values.shape, dtype=int)
+    if notation.lower() in ('sci', 'scientific'):
+        magnitude = np.abs(values)
+        scientific = (magnitude < 0.01) | (magnitude >= 1000)
+        with np.errstate(divide='ignore'):
+            exponents = np.floor(np.log10(magnitude[scientific]))
+        exponent[scientific] = np.where(np.isfinite(exponents), exponents, 0)
+    else:
+        scientific = np.zeros(values.shape, dtype=bool)
+
+    # Mantissas (the values themselves in standard notation)
+    scale = 10.0**(-exponent)
+    digits = np.maximum(0, decimals + exponent)
+
+    strings = np.empty(values.shape, dtype=object)
+    for d in np.unique(digits):
+        for sci in (False, True):
+            mask = (digits == d) & (scientific == sci)
+            if not mask.any():
+                continue
+            fmt = f'%.{d}f'
+            pair = np.char.add(
+                np.char.add(np.char.mod(fmt, values[mask] * scale[mask]), ' ± '),
+                np.char.mod(fmt, uncertainties[mask] * scale[mask])
+                )
+            if sci:
+                pair = np.char.add(
+                    np.char.add(np.char.add('(', pair), ')·10^'),
+                    exponent[mask].astype(str)
+                    )
+            strings[mask] = pair
+    return strings
+
+def round_numeric(values, uncertainties, check=True):
+    '''
+    Round values based on their uncertainties (vectorized), keeping them as
+    numbers: the rules of round_with_uncertainty without the formatting.
+
+    Parameters:
+        - values : array-like, measured values
+        - uncertainties : array-like or float, uncertainties of the measurements
+        - check : bool, whether to check for negative uncertainties (False
+            for already validated or propagated uncertainties)
+    Returns:
+        - values : array of float, rounded values
+        - uncertainties : array of float, rounded uncertainties
+        - decimals : array of int, decimal places of each value
+    '''
+    values, uncertainties = np.broadcast_arrays(
+        np.asarray(values, dtype=float), np.asarray(uncertainties, dtype=float)
+        )
+    if check and np.any(uncertainties < 0):
+        warnings.warn("Uncertainty must be positive, using absolute value")
+        uncertainties = np.abs(uncertainties)
+
+    decimals = rounding_decimals(uncertainties)
+    return (
+        round_to_decimals(values, decimals),
+        round_to_decimals(uncertainties, decimals),
+        decimals
+        )
+
+def round_with_uncertainty_array(values, uncertainties, notation='standard', check=True):
+    '''
+    Vectorized round_with_uncertainty: the exponents, decimal places and
+    rounded values are computed as arrays and the strings are built in bulk.
+
+    Parameters:
+        - values : array-like, measured values
+        - uncertainties : array-like or float, uncertainties of the measurements
+        - notation : str, 'standard' or 'sci' for scientific notation
+        - check : bool, whether to check for negative uncertainties
+    Returns:
+        - array of str : formatted strings "value ± uncertainty"
+    '''
+    rounded_values, rounded_uncertainties, decimals = round_numeric(
+        values, uncertainties, check
+        )
+    strings = format_with_uncertainty(
+        rounded_values, rounded_uncertainties, decimals, notation
+        )
+    strings[np.isnan(rounded_values) | np.isnan(rounded_uncertainties)] = 'nan ± nan'
+    return strings
+
+def rounder(value, uncertainty, notation='standard', numeric=False, check=True):
     '''
     Rounds a single value or an iterable of values with their uncertainties.
     The uncertainty cut-off rounding is 29.
@@ -76,12 +230,18 @@ def rounder(value, uncertainty, notation='standard'):
         - value : float or iterable, value(s) to round
         - uncertainty : float or iterable, uncertainty(ies) to round
         - notation : str, optional, 'standard' or 'sci'
+        - numeric : bool, optional, return numbers instead of strings (see round_numeric)
+        - check : bool, optional, whether to check the uncertainties of
+            iterables for negative values (False if already validated)
     Returns:
         - str or list : Formatted string(s) "value ± uncertainty"
+        - (values, uncertainties, decimals) : arrays, if numeric
     '''
 
-    if isiterable(value):
-        return [ round_with_uncertainty(val, err, notation) for val, err in zip(value, uncertainty) ]
+    if numeric:
+        return round_numeric(value, uncertainty, check)
+    elif isiterable(value):
+        return round_with_uncertainty_array(value, uncertainty, notation, check).tolist()
     elif math.isnan(value):
         return 'nan ± nan'
     elif isinstance(value, (int, float)):
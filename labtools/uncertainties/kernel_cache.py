@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent on-disk cache of the numeric kernels of compiled formulas.
+
+The Python source generated for each kernel is stored in a file named after
+a hash of the formula (variables, expression, dependency), the kernel and the
+labtools version. Loading a kernel from the cache only needs numpy (or math,
+numexpr), so new processes evaluate known formulas without importing sympy.
+
+The cache is opt-in: call enable_kernel_cache() or set the LABTOOLS_KERNEL_CACHE
+environment variable to the cache directory. The cached files are executed
+when loaded, so the directory must only be writable by trusted users.
+"""
+import builtins
+import dis
+import hashlib
+import inspect
+import math
+import os
+import tempfile
+from functools import lru_cache
+
+import numpy as np
+
+from .. import __version__
+from .kernels import numexpr, FormulaKernels, EquationsKernels
+
+# Environment variable enabling the cache in every process
+ENVIRONMENT_VARIABLE = 'LABTOOLS_KERNEL_CACHE'
+# Cache directory used by enable_kernel_cache() by default
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'labtools', 'kernels')
+# Maximum number of cached formulas kept in memory
+CACHE_SIZE = 128
+
+# Module whose names each kernel uses (lambdify's defaults for 'formula' & 'jacobian')
+KERNEL_MODULES = {
+    'formula': 'numpy', 'jacobian': 'numpy',
+    'formula_math': 'math', 'formula_numexpr': 'numexpr',
+    'numpy': 'numpy', 'math': 'math', 'numexpr': 'numexpr',
+}
+
+_directory = os.environ.get(ENVIRONMENT_VARIABLE) or None
+
+def enable_kernel_cache(directory=None):
+    '''
+    Store the kernels of compiled formulas on disk and load them from there.
+
+    Parameters:
+        - directory: str, optional, cache directory (DEFAULT_DIRECTORY if None)
+    '''
+    global _directory
+    _directory = os.path.abspath(directory or DEFAULT_DIRECTORY)
+
+def disable_kernel_cache():
+    '''Stop using the on-disk kernel cache (the stored files are kept).'''
+    global _directory
+    _directory = None
+
+def kernel_cache_directory():
+    '''Directory of the on-disk kernel cache, None if it is disabled.'''
+    return _directory
+
+def kernel_key(*parts):
+    '''Hash identifying a kernel, from its formula parts and the labtools version'''
+    return hashlib.sha256(repr((__version__, *parts)).encode('utf-8')).hexdigest()
+
+def _namespace(kernel):
+    '''Global names available to the source of a kernel'''
+    module = KERNEL_MODULES.get(kernel, kernel)
+    if module == 'numpy':
+        return dict(vars(np))
+    elif module == 'math':
+        return dict(vars(math))
+    elif module == 'numexpr' and numexpr is not None:
+        return {'numexpr': numexpr}
+    return None
+
+def load_kernel(key, kernel):
+    '''
+    Load a kernel from the cache.
+
+    Parameters:
+        - key: str, kernel hash (see kernel_key)
+        - kernel: str, kernel name ('formula', 'jacobian', 'system' or a backend)
+    Returns:
+        - callable, or None if the kernel isn't cached
+    '''
+    namespace = _namespace(kernel)
+    if _directory is None or namespace is None:
+        return None
+
+    path = os.path.join(_directory, key + '.py')
+    try:
+        with open(path, encoding='utf-8') as file:
+            source = file.read()
+    except OSError:
+        return None
+
+    functions = {}
+    exec(compile(source, path, 'exec'), namespace, functions)
+    return next(iter(functions.values()))
+
+def save_kernel(key, kernel, func):
+    '''
+    Store the source of a kernel in the cache, if it is enabled.
+    Kernels using names that can't be restored without sympy are skipped.
+
+    Parameters:
+        - key: str, kernel hash (see kernel_key)
+        - kernel: str, kernel name ('formula', 'jacobian', 'system' or a backend)
+        - func: callable, lambdified kernel
+    '''
+    namespace = _namespace(kernel)
+    if _directory is None or namespace is None:
+        return
+
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        return
+    names = {
+        instruction.argval for instruction in dis.get_instructions(func)
+        if instruction.opname == 'LOAD_GLOBAL'
+        }
+    for name in names:
+        if name in func.__globals__:
+            if namespace.get(name, None) is not func.__globals__[name]:
+                return
+        elif not hasattr(builtins, name):
+            return
+
+    # Atomic write, other processes never read a partial file
+    os.makedirs(_directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=_directory, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+            file.write(source)
+        os.replace(temporary, os.path.join(_directory, key + '.py'))
+    except OSError:
+        os.remove(temporary)
+
+class CachedFormula(FormulaKernels):
+    '''
+    Formula whose kernels are loaded from the on-disk cache when possible.
+    Missing kernels and symbolic attributes (formula_symb, gradient, latex, ...)
+    are taken from the CompiledFormula, which is only built (with sympy)
+    when first needed and stores its kernels in the cache.
+
+    Attributes:
+        - variables: tuple of str, variable names (in order)
+        - expression: str, formula expression without "=" sign
+        - dependency: str, dependency type
+            ('Dependent', 'Independent', 'Covariance' or 'SecondOrder')
+    '''
+    def __init__(self, variables, expression, dependency='Independent'):
+        self._compiled = None
+        self.variables = tuple(variables)
+        self.expression = expression
+        self.dependency = dependency
+        self._kernels = {}
+
+    def __repr__(self):
+        return (
+            f"CachedFormula(variables={self.variables}, "
+            f"expression='{self.expression}', dependency='{self.dependency}')"
+            )
+
+    def compiled(self):
+        '''CompiledFormula of the expression, derived with sympy'''
+        if self._compiled is None:
+            from .compiled import _compile_formula
+            self._compiled = _compile_formula(self.variables, self.expression, self.dependency)
+        return self._compiled
+
+    def __getattr__(self, name):
+        # Only called for attributes that aren't numeric kernels
+        if name.startswith('__') or name == '_compiled':
+            raise AttributeError(name)
+        return getattr(self.compiled(), name)
+
+    def _load(self, kernel):
+        if kernel not in self._kernels:
+            func = load_kernel(
+                kernel_key(self.variables, self.expression, self.dependency, kernel), kernel
+                )
+            if func is None:
+                compiled = self.compiled()
+                if kernel == 'formula':
+                    func = compiled.formula_func
+                elif kernel.startswith('formula_'):
+                    func = compiled.formula_kernel(kernel[len('formula_'):])
+                elif kernel == 'jacobian':
+                    func = compiled.jacobian_func
+                else:
+                    func = compiled.kernel(kernel)
+            self._kernels[kernel] = func
+        return self._kernels[kernel]
+
+    @property
+    def formula_func(self):
+        '''Lambda function for the formula'''
+        return self._load('formula')
+
+    def formula_kernel(self, backend='numpy'):
+        '''Lambda function of the formula alone'''
+        return self._load('formula' if backend == 'numpy' else f'formula_{backend}')
+
+    @property
+    def jacobian_func(self):
+        '''Lambda function returning the formula and its gradient'''
+        return self._load('jacobian')
+
+    @property
+    def fused_func(self):
+        '''Lambda function returning (formula, uncertainty) in one pass'''
+        return None if self.dependency == 'Covariance' else self._load('numpy')
+
+    def kernel(self, backend='numpy'):
+        '''Fused lambda function returning (formula, uncertainty)'''
+        return self._load(backend)
+
+class CachedEquations(EquationsKernels):
+    '''
+    Several formulas whose shared kernel is loaded from the on-disk cache when
+    possible. The formulas are only compiled (with sympy) when first needed.
+
+    Attributes:
+        - variables: tuple of str, variable names (in order)
+        - expressions: tuple of str, mathematical expressions without "=" sign
+        - dependencies: tuple of str, dependency type of each expression
+        - result_names: tuple of str, result name of each expression (or None)
+    '''
+    def __init__(self, variables, expressions, dependencies, result_names=None):
+        self._compiled = None
+        self.variables = tuple(variables)
+        self.expressions = tuple(expressions)
+        self.dependencies = tuple(dependencies)
+        self.result_names = result_names
+        self._kernels = {}
+
+    def __repr__(self):
+        return (
+            f"CachedEquations(variables={self.variables}, "
+            f"expressions={list(self.expressions)})"
+            )
+
+    def compiled(self):
+        '''CompiledEquations of the expressions, derived with sympy'''
+        if self._compiled is None:
+            from .compiled import _compile_equations
+            self._compiled = _compile_equations(
+                self.variables, self.expressions, self.dependencies, self.result_names
+                )
+        return self._compiled
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name == '_compiled':
+            raise AttributeError(name)
+        return getattr(self.compiled(), name)
+
+    def _load(self, kernel):
+        if kernel not in self._kernels:
+            func = load_kernel(
+                kernel_key(
+                    self.variables, self.expressions, self.dependencies,
+                    self.result_names, 'system', kernel
+                    ),
+                kernel
+                )
+            if func is None:
+                compiled = self.compiled()
+                if kernel == 'jacobian':
+                    func = compiled.jacobian_func
+                else:
+                    func = compiled.kernel(kernel)
+            self._kernels[kernel] = func
+        return self._kernels[kernel]
+
+    @property
+    def jacobian_func(self):
+        '''Lambda function returning all the formulas and their gradients'''
+        return self._load('jacobian')
+
+    def kernel(self, backend='numpy'):
+        '''Lambda function returning (value_1, uncertainty_1, value_2, ...)'''
+        return self._load(backend)
+
+def get_cached_formula(variables_str, expression_str, dependency='Independent'):
+    '''
+    Get the formula of an expression, from the on-disk kernel cache if it is
+    enabled (without importing sympy) or else compiled with sympy.
+
+    Parameters:
+        - variables_str: string, variables separated by commas
+        - expression_str: string, mathematical expression without "=" sign
+        - dependency: string with the dependency type
+            ('Dependent', 'Independent', 'Covariance' or 'SecondOrder')
+    Returns:
+        - CachedFormula or CompiledFormula
+    '''
+    variables = tuple(v.strip() for v in variables_str.split(','))
+    expression = expression_str.replace(' ', '')
+    if _directory is None:
+        from .compiled import _compile_formula
+        return _compile_formula(variables, expression, dependency)
+    return _cached_formula(variables, expression, dependency, _directory)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _cached_formula(variables, expression, dependency, directory):
+    return CachedFormula(variables, expression, dependency)
+
+def get_cached_equations(variables_str, expressions, dependencies, result_names=None):
+    '''
+    Get the system of several expressions of the same variables, from the
+    on-disk kernel cache if it is enabled or else compiled with sympy.
+
+    Parameters:
+        - variables_str: string, variables separated by commas
+        - expressions: list of str, mathematical expressions without "=" sign
+        - dependencies: list of str, dependency type of each expression
+        - result_names: list of str, optional, result name of each expression,
+            which the other expressions can use
+    Returns:
+        - CachedEquations or CompiledEquations
+    '''
+    variables = tuple(v.strip() for v in variables_str.split(','))
+    expressions = tuple(expression.replace(' ', '') for expression in expressions)
+    if result_names is not None:
+        result_names = tuple(name.strip() for name in result_names)
+    if _directory is None:
+        from .compiled import _compile_equations
+        return _compile_equations(variables, expressions, tuple(dependencies), result_names)
+    return _cached_equations(
+        variables, expressions, tuple(dependencies), result_names, _directory
+        )
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _cached_equations(variables, expressions, dependencies, result_names, directory):
+    return CachedEquations(variables, expressions, dependencies, result_names)
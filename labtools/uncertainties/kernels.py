@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Numeric evaluation of formula kernels.
+
+The evaluation only needs the lambdified kernels of a formula, not its
+symbolic expressions, so it is shared by the formulas compiled with sympy
+and by those loaded from the on-disk kernel cache.
+"""
+import numpy as np
+
+from .utils.arrays import as_arrays
+from .utils.covariance import (
+    contract_covariance, uncorrelated_variance, output_covariance, uncertainty_budget
+    )
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+# Minimum number of rows for the numexpr backend to pay off
+NUMEXPR_MIN_SIZE = 100_000
+
+class FormulaKernels:
+    '''
+    Evaluation of a formula from its kernels.
+    Subclasses provide the dependency, kernel(backend) and jacobian_func.
+    '''
+    def __call__(self, values, uncertainties=None, covariance=None, backend='auto'):
+        '''
+        Evaluate the formula and its uncertainty.
+
+        Parameters:
+            - values: array-like, values of the variables (one subarray per variable)
+            - uncertainties: array-like, uncertainties of the variables
+            - covariance: array-like, optional, only for 'Covariance' dependency.
+                Covariance matrix of the variables, shared (K, K) or per row (N, K, K).
+                If None, the variables are taken as uncorrelated.
+            - backend: str, numeric backend ('numpy', 'numexpr', 'math'),
+                'auto' selects it from the input size (see select_backend)
+        Returns:
+            - result: array-like, calculated result
+            - uncertainty: array-like, related uncertainty
+        '''
+        if self.dependency == 'Covariance':
+            result, jacobian = self.jacobian(values)
+            if covariance is None:
+                variance = uncorrelated_variance(jacobian, as_arrays(uncertainties))
+            else:
+                variance = contract_covariance(jacobian, covariance)
+            return result, np.sqrt(variance)
+
+        selected = select_backend(values, uncertainties, backend)
+        if selected == 'math':
+            try:
+                return self.kernel('math')(*values, *uncertainties)
+            except (ValueError, ZeroDivisionError, OverflowError):
+                if backend == 'math':
+                    raise
+                # Out of domain: numpy returns nan/inf instead of raising
+                selected = 'numpy'
+
+        # Constant values & uncertainties stay scalars, broadcast by the kernel
+        return self.kernel(selected)(*as_arrays(values), *as_arrays(uncertainties))
+
+    def jacobian(self, values):
+        '''
+        Evaluate the formula and its gradient for all rows at once.
+
+        Parameters:
+            - values: array-like, values of the variables (one subarray per variable)
+        Returns:
+            - result: array-like, calculated result
+            - jacobian: array, partial derivatives with shape (K, ...),
+                one row per variable
+        '''
+        result, partials = self.jacobian_func(*as_arrays(values))
+        # Constant partial derivatives are returned as scalars
+        jacobian = np.array(np.broadcast_arrays(result, *partials)[1:], dtype=float)
+        return result, jacobian
+
+    def budget(self, values, uncertainties):
+        '''
+        Evaluate the formula and the uncertainty budget of every row,
+        from the gradient of the formula (to first order).
+
+        Parameters:
+            - values: array-like, values of the variables (one subarray per variable)
+            - uncertainties: array-like, uncertainties of the variables
+        Returns:
+            - result: array-like, calculated result
+            - contributions: array, |∂f/∂xᵢ|·δxᵢ with shape (K, ...)
+            - shares: array, percentage of the uncertainty due to each
+                variable with shape (K, ...)
+        '''
+        result, jacobian = self.jacobian(values)
+        contributions, shares = uncertainty_budget(
+            jacobian, as_arrays(uncertainties), self.dependency
+            )
+        return result, contributions, shares
+
+class EquationsKernels:
+    '''
+    Evaluation of several formulas from their shared kernel.
+    Subclasses provide kernel(backend) and jacobian_func.
+    '''
+    def __call__(self, values, uncertainties, backend='auto'):
+        '''
+        Evaluate all the formulas and their uncertainties in a single pass.
+
+        Parameters:
+            - values: list of array-like, values of the variables
+            - uncertainties: list of array-like or float, uncertainties of the variables
+            - backend: str, numeric backend ('numpy', 'numexpr', 'math' or 'auto')
+        Returns:
+            - list of (result, uncertainty) tuples, one per formula
+        '''
+        backend = select_backend(values, uncertainties, backend)
+        outputs = self.kernel(backend)(*values, *uncertainties)
+        return list(zip(outputs[::2], outputs[1::2]))
+
+    def jacobian(self, values):
+        '''
+        Evaluate all the formulas and their gradients for all rows at once.
+
+        Parameters:
+            - values: list of array-like, values of the variables
+        Returns:
+            - results: array, calculated results with shape (M, ...), one row per formula
+            - jacobians: array, partial derivatives with shape (M, K, ...),
+                one row per formula and one column per variable
+        '''
+        results, partials = self.jacobian_func(*as_arrays(values))
+        # Constant results & partial derivatives are returned as scalars
+        arrays = np.broadcast_arrays(*results, *(d for gradient in partials for d in gradient))
+        M = len(results)
+        results = np.array(arrays[:M], dtype=float)
+        jacobians = np.array(arrays[M:], dtype=float).reshape(M, -1, *results.shape[1:])
+        return results, jacobians
+
+    def covariance(self, values, uncertainties=None, covariance=None):
+        '''
+        Evaluate all the formulas and the covariance matrix between them,
+        propagated to first order, for all rows at once.
+
+        Parameters:
+            - values: list of array-like, values of the variables
+            - uncertainties: list of array-like or float, uncertainties of the
+                variables, taken as uncorrelated (used if covariance is None)
+            - covariance: array-like, optional, covariance matrix of the
+                variables, shared (K, K) or per row (N, K, K)
+        Returns:
+            - results: array, calculated results with shape (M, ...)
+            - covariance: array, covariance of the results with shape (..., M, M)
+        '''
+        results, jacobians = self.jacobian(values)
+        uncertainties = None if uncertainties is None else as_arrays(uncertainties)
+        return results, output_covariance(jacobians, uncertainties, covariance)
+
+    def budget(self, values, uncertainties):
+        '''
+        Evaluate all the formulas and their uncertainty budgets for every row,
+        from the shared jacobian kernel (to first order).
+
+        Parameters:
+            - values: list of array-like, values of the variables
+            - uncertainties: list of array-like or float, uncertainties of the variables
+        Returns:
+            - results: array, calculated results with shape (M, ...)
+            - contributions: array, |∂f/∂xᵢ|·δxᵢ with shape (M, K, ...)
+            - shares: array, percentage of the uncertainty of each formula due
+                to each variable with shape (M, K, ...)
+        '''
+        results, jacobians = self.jacobian(values)
+        uncertainties = as_arrays(uncertainties)
+        budgets = [
+            uncertainty_budget(jacobian, uncertainties, dependency)
+            for jacobian, dependency in zip(jacobians, self.dependencies)
+            ]
+        contributions, shares = (np.array(arrays) for arrays in zip(*budgets))
+        return results, contributions, shares
+
+def select_backend(values, uncertainties=(), backend='auto'):
+    '''
+    Select the numeric backend of the lambda functions.
+    'auto' picks 'math' for scalars, 'numexpr' (if installed) for large
+    arrays and 'numpy' otherwise.
+
+    Parameters:
+        - values: array-like, values of the variables
+        - uncertainties: array-like, uncertainties of the variables
+        - backend: str, 'auto', 'numpy', 'numexpr' or 'math'
+    Returns:
+        - str, numeric backend
+    '''
+    if backend != 'auto':
+        return backend
+
+    inputs = [*values, *uncertainties]
+    if all(isinstance(x, (int, float)) for x in inputs):
+        return 'math'
+    elif numexpr is not None and max(np.size(x) for x in inputs) >= NUMEXPR_MIN_SIZE:
+        return 'numexpr'
+    else:
+        return 'numpy'
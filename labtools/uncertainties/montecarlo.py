@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo uncertainty propagation.
+
+Samples of every variable are drawn for all rows at once and pushed through
+the lambdified formula kernel of the selected backend. Rows are processed in chunks so that the
+rows × samples arrays never exceed a memory budget.
+"""
+import numpy as np
+
+from .kernels import numexpr, NUMEXPR_MIN_SIZE
+from .utils.errors import UncertaintyError
+
+# Default number of samples per row
+N_SAMPLES = 10_000
+# Default percentile interval (%), equivalent to ±1σ for a normal distribution
+INTERVAL = 68.27
+# Maximum memory (bytes) used by the samples of a chunk of rows
+MEMORY_BUDGET = 32 * 1024**2
+
+def monte_carlo(
+        compiled, values, uncertainties=None, covariance=None,
+        n_samples=N_SAMPLES, seed=None, interval=INTERVAL,
+        memory_budget=MEMORY_BUDGET, backend='numpy'
+        ):
+    '''
+    Propagate uncertainties through a compiled formula by Monte Carlo sampling.
+    Variables are sampled from normal distributions, independently unless
+    a covariance matrix is given. All rows share the same standard normal
+    draws, which are scaled and shifted to each row's distribution.
+
+    Parameters:
+        - compiled: CompiledFormula, formula to evaluate
+        - values: array-like, values of the variables (one subarray per variable)
+        - uncertainties: array-like, uncertainties of the variables
+        - covariance: array-like, optional, covariance matrix of the variables,
+            shared (K, K) or per row (N, K, K). Overrides the uncertainties.
+        - n_samples: int, number of samples per row
+        - seed: int or np.random.Generator, optional, random seed
+        - interval: float, percentile interval width (%) centred on the median,
+            if None the (slower) percentiles are not computed
+        - memory_budget: int, maximum bytes used by the samples of a chunk
+        - backend: str, numeric backend of the formula ('numpy' or 'numexpr'),
+            'auto' selects numexpr (if installed) for large chunks of samples
+    Returns:
+        - mean: array-like, mean of the sampled result
+        - std: array-like, standard deviation of the sampled result
+        - (lower, upper): tuple of array-like, percentile interval bounds
+            (None if interval is None)
+    '''
+    rng = np.random.default_rng(seed)
+
+    values = np.array(np.broadcast_arrays(*values), dtype=float)
+    K, rows_shape = len(values), values.shape[1:]
+    values = values.reshape(K, -1)
+    N = values.shape[1]
+
+    if covariance is not None:
+        covariance = np.asarray(covariance, dtype=float)
+        if covariance.shape[-2:] != (K, K):
+            raise UncertaintyError(
+                f'Covariance matrix must have shape ({K}, {K}) or (N, {K}, {K}), '
+                f'got {covariance.shape}'
+            )
+        try:
+            cholesky = np.linalg.cholesky(covariance)
+        except np.linalg.LinAlgError:
+            raise UncertaintyError('Covariance matrix must be positive definite')
+        if cholesky.ndim == 3:
+            cholesky = cholesky.reshape(N, K, K)
+    else:
+        # Constant uncertainties stay scalars
+        uncertainties = [
+            δx if np.ndim(δx) == 0 else np.broadcast_to(δx, rows_shape).reshape(N)
+            for δx in uncertainties
+            ]
+
+    # Standard normal draws, shared by all rows
+    z = rng.standard_normal((K, n_samples))
+    if covariance is not None and cholesky.ndim == 2:
+        z = cholesky @ z
+
+    # Rows per chunk: K input samples, the result & one temporary per row
+    chunk = max(1, int(memory_budget // (8 * n_samples * (K + 2))))
+    if backend == 'auto':
+        large = min(chunk, N) * n_samples >= NUMEXPR_MIN_SIZE
+        backend = 'numexpr' if numexpr is not None and large else 'numpy'
+    elif backend == 'math':
+        raise UncertaintyError("The 'math' backend can't evaluate arrays of samples")
+    formula = compiled.formula_func if backend == 'numpy' else compiled.formula_kernel(backend)
+    mean, std = np.empty(N), np.empty(N)
+    if interval is not None:
+        percentiles = [50 - interval/2, 50 + interval/2]
+        lower, upper = np.empty(N), np.empty(N)
+
+    for start in range(0, N, chunk):
+        rows = slice(start, min(start + chunk, N))
+        μ = values[:, rows, None]
+
+        if covariance is None:
+            samples = np.empty((K, μ.shape[1], n_samples))
+            for k, δx in enumerate(uncertainties):
+                σ = δx if np.ndim(δx) == 0 else δx[rows, None]
+                np.multiply(σ, z[k], out=samples[k])
+            samples += μ
+        elif cholesky.ndim == 2:
+            samples = μ + z[:, None, :]
+        else:
+            samples = μ + np.einsum('rij,js->irs', cholesky[rows], z)
+
+        result = formula(*samples)
+        result = np.broadcast_to(result, samples.shape[1:])
+        del samples
+
+        mean[rows] = result.mean(axis=-1)
+        std[rows] = result.std(axis=-1, ddof=1)
+        if interval is not None:
+            lower[rows], upper[rows] = np.percentile(result, percentiles, axis=-1)
+
+    reshape = lambda x: x.reshape(rows_shape) if rows_shape else x[0]
+    if interval is None:
+        return reshape(mean), reshape(std), None
+    return reshape(mean), reshape(std), (reshape(lower), reshape(upper))
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Uncertainty propagation through black-box Python callables.
+
+The Jacobian is computed numerically, with one vectorized call of the
+function per variable: complex-step differentiation when the function
+accepts complex inputs, central finite differences otherwise.
+"""
+import warnings
+
+import numpy as np
+
+from .utils.arrays import as_arrays
+from .utils.covariance import contract_covariance, uncorrelated_variance
+from .utils.errors import UncertaintyError
+
+# Complex step, exact up to machine precision for analytic functions
+COMPLEX_STEP = 1e-20
+# Relative step of the central differences, ~ε^(1/3)
+CENTRAL_STEP = np.finfo(float).eps ** (1/3)
+
+ComplexWarning = getattr(np, 'exceptions', np).ComplexWarning
+
+def numerical_jacobian(func, values, method='auto'):
+    '''
+    Evaluate a function and its Jacobian for all rows at once.
+
+    Parameters:
+        - func: callable, f(*values) -> result, vectorized over the rows
+        - values: array-like, values of the variables (one subarray per variable)
+        - method: str, 'complex' (complex-step), 'central' (central differences)
+            or 'auto' (complex-step if the function supports it)
+    Returns:
+        - result: array-like, calculated result
+        - jacobian: array, partial derivatives with shape (K, ...),
+            one row per variable
+    '''
+    values = np.array(np.broadcast_arrays(*values), dtype=float)
+    result = func(*values)
+
+    if method == 'auto':
+        method = 'complex' if _supports_complex(func, values) else 'central'
+
+    jacobian = np.empty(
+        (len(values),) + np.broadcast_shapes(np.shape(result), values.shape[1:])
+        )
+
+    for i, x in enumerate(values):
+        arguments = list(values)
+        if method == 'complex':
+            arguments[i] = x + 1j*COMPLEX_STEP
+            jacobian[i] = np.imag(func(*arguments)) / COMPLEX_STEP
+        elif method == 'central':
+            h = CENTRAL_STEP * np.maximum(np.abs(x), 1)
+            arguments[i] = x + h
+            forward = func(*arguments)
+            arguments[i] = x - h
+            backward = func(*arguments)
+            jacobian[i] = (forward - backward) / (2*h)
+        else:
+            raise UncertaintyError(
+                f"Invalid method: {method}. Must be 'auto', 'complex' or 'central'."
+            )
+
+    return result, jacobian
+
+def _supports_complex(func, values):
+    '''Check if the function propagates complex inputs (needed for complex-step)'''
+    arguments = list(values)
+    arguments[0] = values[0] + 1j*COMPLEX_STEP
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', ComplexWarning)
+        try:
+            return np.iscomplexobj(func(*arguments))
+        except (TypeError, ValueError, ComplexWarning):
+            return False
+
+def propagate_callable(
+        func, values, uncertainties=None, dependency='Independent',
+        covariance=None, method='auto'
+        ):
+    '''
+    Calculate the result and uncertainty of a Python callable for given values
+    and uncertainties, e.g. calibration tables, interpolators or fitted models.
+    Note: complex-step derivatives are wrong for non-analytic functions (abs,
+    comparisons, ...), use method='central' for them.
+
+    Parameters:
+        - func: callable, f(*values) -> result, vectorized over the rows
+        - values: array-like, values of the variables (one subarray per variable)
+        - uncertainties: array-like, uncertainties of the variables
+        - dependency: string with the dependency type
+            ('Dependent', 'Independent' or 'Covariance')
+        - covariance: array-like, optional, covariance matrix of the variables
+            for the 'Covariance' dependency, shared (K, K) or per row (N, K, K)
+        - method: str, 'complex', 'central' or 'auto' differentiation
+    Returns:
+        - result: array-like, calculated result
+        - uncertainty: array-like, related uncertainty
+    '''
+    result, jacobian = numerical_jacobian(func, values, method)
+
+    uncertainties = as_arrays(uncertainties) if uncertainties is not None else None
+    if dependency == 'Covariance':
+        if covariance is None:
+            return result, np.sqrt(uncorrelated_variance(jacobian, uncertainties))
+        return result, np.sqrt(contract_covariance(jacobian, covariance))
+
+    terms = [diffx * δx for diffx, δx in zip(jacobian, uncertainties)]
+
+    if dependency == 'Dependent':
+        # Sum of absolutes
+        uncertainty = sum(np.abs(term) for term in terms)
+    elif dependency == 'Independent':
+        # Square root of sum of squares
+        uncertainty = np.sqrt(sum(term**2 for term in terms))
+    else:
+        raise UncertaintyError(
+            f'Invalid dependency type: {dependency}. '
+            "Must be 'Dependent', 'Independent' or 'Covariance'."
+        )
+
+    return result, uncertainty
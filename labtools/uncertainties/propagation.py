@@ -6,12 +6,16 @@ Created on Tue Jun 30 21:13:45 2020
 """
 import numpy as np
 
-from .utils.latex import latex_escape_special_characters
-from .utils.symbolic import sp, create_formula_and_uncertainty, create_lambda_functions
+from .autodiff import get_autodiff_formula
+from .kernel_cache import get_cached_formula
+from .montecarlo import monte_carlo, N_SAMPLES, INTERVAL, MEMORY_BUDGET
+from .utils.errors import UncertaintyError
 
 def propagate_uncertainty(
         variables_str, expression_str, values, uncertainties,
-        dependency='Independent'
+        dependency='Independent', covariance=None,
+        method='linear', n_samples=N_SAMPLES, seed=None, engine='symbolic',
+        backend='auto', interval=INTERVAL, memory_budget=MEMORY_BUDGET
         ):
     '''
     Calculate the result and uncertainty of a formula for given values and uncertainties.
@@ -21,28 +25,132 @@ def propagate_uncertainty(
         - expression_str: string, mathematical expression without "=" sign
         - values: array-like, values of the variables
         - uncertainties: array-like, uncertainties of the variables
-        - dependency: string with the dependency type ('Dependent' or 'Independent')
+        - dependency: string with the dependency type
+            ('Dependent', 'Independent', 'Covariance' or 'SecondOrder')
+        - covariance: array-like, optional, covariance matrix of the variables
+            for the 'Covariance' dependency, shared (K, K) or per row (N, K, K)
+        - method: string, 'linear' (first-order) or 'montecarlo' propagation
+        - n_samples: int, number of samples per row ('montecarlo' only)
+        - seed: int, optional, random seed ('montecarlo' only)
+        - engine: string, how the gradient is derived, 'symbolic' (sympy)
+            or 'autodiff' (forward-mode dual numbers, without sympy)
+        - backend: string, numeric backend of the symbolic engine, 'numpy',
+            'numexpr' or 'math' (scalars, 'linear' only); 'auto' selects it
+            from the input size
+        - interval: float, percentile interval width (%) ('montecarlo' only),
+            if None the (slower) percentiles are not computed
+        - memory_budget: int, maximum bytes used by the samples of a chunk
+            of rows ('montecarlo' only)
     Returns:
-        - result: array-like, calculated result
-        - uncertainty: array-like, related uncertainty
+        - result: array-like, calculated result (mean for 'montecarlo')
+        - uncertainty: array-like, related uncertainty (std for 'montecarlo')
+        - (lower, upper): percentile interval of the result ('montecarlo' only,
+            None if interval is None)
     '''
-    # Create symbolic expressions
-    formula_symb, uncertainty_symb = create_formula_and_uncertainty(
-        variables_str, expression_str, dependency
+    # Formula kernels (derived once per formula)
+    if engine == 'symbolic':
+        # sympy is only imported when the formula isn't in the kernel cache
+        compiled = get_cached_formula(variables_str, expression_str, dependency)
+    elif engine == 'autodiff':
+        compiled = get_autodiff_formula(variables_str, expression_str, dependency)
+    else:
+        raise UncertaintyError(
+            f"Invalid engine: {engine}. Must be 'symbolic' or 'autodiff'."
         )
-    # Create lambda functions
-    formula_func, uncertainty_func = create_lambda_functions(
-        variables_str, formula_symb, uncertainty_symb
+    
+    if method == 'linear' and engine == 'symbolic':
+        return compiled(values, uncertainties, covariance, backend)
+    elif method == 'linear':
+        return compiled(values, uncertainties, covariance)
+    elif method == 'montecarlo':
+        return monte_carlo(
+            compiled, values, uncertainties, covariance, n_samples=n_samples, seed=seed,
+            interval=interval, memory_budget=memory_budget,
+            # The autodiff engine has a single (numpy) formula
+            backend=backend if engine == 'symbolic' else 'numpy'
+            )
+    else:
+        raise UncertaintyError(
+            f"Invalid method: {method}. Must be 'linear' or 'montecarlo'."
         )
+
+def propagate_scalar(
+        variables_str, expression_str, values, uncertainties,
+        dependency='Independent'
+        ):
+    '''
+    Fast path for a single measurement: plain floats in and out,
+    evaluated with the cached scalar ('math') kernel of the formula.
+
+    Parameters:
+        - variables_str: string, variables separated by commas
+        - expression_str: string, mathematical expression without "=" sign
+        - values: float or sequence of floats, value of each variable
+        - uncertainties: float or sequence of floats, uncertainty of each variable
+        - dependency: string with the dependency type
+            ('Dependent', 'Independent', 'Covariance' or 'SecondOrder')
+    Returns:
+        - result: float, calculated result
+        - uncertainty: float, related uncertainty
+    '''
+    if isinstance(values, (int, float)):
+        values, uncertainties = (values,), (uncertainties,)
+    
+    compiled = get_cached_formula(variables_str, expression_str, dependency)
+    result, uncertainty = compiled(values, uncertainties)
     
-    # Ensure values and uncertainties are arrays
-    values = np.asarray(values)
-    uncertainties = np.asarray(uncertainties)
+    return float(result), float(uncertainty)
+
+def propagate_batch(
+        variables_str, expression_str, measurements, dependency='Independent'
+        ):
+    '''
+    Propagate uncertainties for a list of measurements in a single
+    vectorized call.
+
+    Parameters:
+        - variables_str: string, variables separated by commas
+        - expression_str: string, mathematical expression without "=" sign
+        - measurements: list of (values, uncertainties) tuples, with the
+            float or sequence of floats of each variable
+        - dependency: string with the dependency type
+            ('Dependent', 'Independent', 'Covariance' or 'SecondOrder')
+    Returns:
+        - list of (result, uncertainty) tuples of floats
+    '''
+    values, uncertainties = zip(*measurements)
+    N = len(measurements)
+    # One row per variable
+    values = np.array(values, dtype=float).reshape(N, -1).T
+    uncertainties = np.array(uncertainties, dtype=float).reshape(N, -1).T
     
-    result = formula_func(*values)
-    uncertainty = uncertainty_func(*values, *uncertainties)
+    compiled = get_cached_formula(variables_str, expression_str, dependency)
+    result, uncertainty = compiled(values, uncertainties, backend='numpy')
+    result, uncertainty = np.broadcast_arrays(result, uncertainty, values[0])[:2]
     
-    return result, uncertainty
+    return list(zip(result.tolist(), uncertainty.tolist()))
+
+def get_uncertainty_budget(
+        variables_str, expression_str, values, uncertainties, dependency='Independent'
+        ):
+    '''
+    Contribution of each variable to the uncertainty of a formula, for every row,
+    from the compiled gradient of the formula (no extra symbolic work).
+
+    Parameters:
+        - variables_str: string, variables separated by commas
+        - expression_str: string, mathematical expression without "=" sign
+        - values: array-like, values of the variables
+        - uncertainties: array-like, uncertainties of the variables
+        - dependency: string with the dependency type, 'Dependent' shares
+            are of the linear sum, the others of the (first-order) variance
+    Returns:
+        - result: array-like, calculated result
+        - contributions: array, |∂f/∂xᵢ|·δxᵢ with shape (K, ...), one row per variable
+        - shares: array, percentage of the uncertainty due to each variable
+    '''
+    compiled = get_cached_formula(variables_str, expression_str, dependency)
+    return compiled.budget(values, uncertainties)
 
 def get_latex_equations(
         variables, equation, dependency='Independent', print_latex=True):
@@ -53,7 +161,8 @@ def get_latex_equations(
     Parameters:
         - variables: str,   Variables separated by commas
         - equation: str,    Equation expression
-        - dependency: str,  Dependency type ('Dependent' or 'Independent')
+        - dependency: str,  Dependency type
+            ('Dependent', 'Independent', 'Covariance' or 'SecondOrder')
         - print_latex: bool, Whether to print the LaTeX code
     Returns:
         - result_variable: str, Result variable name
@@ -67,25 +176,16 @@ def get_latex_equations(
         result_variable = 'f'
         expression = equation
 
-    result_uncert = 'δ' + result_variable
-
-    # Create symbolic expressions
-    formula_symb, uncertainty_symb = create_formula_and_uncertainty(
-        variables, expression, dependency
-    )
-    # Create symbolic equations
-    formula_eq = sp.Eq(sp.Symbol(result_variable), formula_symb)
-    uncertainty_eq = sp.Eq(sp.Symbol(result_uncert), uncertainty_symb)
+    from .compiled import get_compiled_formula
+    compiled = get_compiled_formula(variables, expression, dependency)
 
     if print_latex:
+        from .utils.symbolic import sp
+        formula_eq, uncertainty_eq = compiled.equations(result_variable)
         sp.pprint(formula_eq)
         sp.pprint(uncertainty_eq)
     
-    # Convert to LaTeX
-    formula_latex = sp.latex(formula_eq)
-    uncertainty_latex = sp.latex(uncertainty_eq)
-
-    formula_latex = latex_escape_special_characters(formula_latex, structure=False)
-    uncertainty_latex = latex_escape_special_characters(uncertainty_latex, structure=False)
+    # Convert to LaTeX (cached in the compiled formula)
+    formula_latex, uncertainty_latex = compiled.latex(result_variable)
 
     return result_variable, formula_latex, uncertainty_latex
\ No newline at end of file
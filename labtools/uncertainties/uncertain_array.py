@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Arrays of values with their uncertainties.
+
+UncertainArray implements the NumPy ufunc protocol: arithmetic operators and
+ufuncs (np.sqrt, np.exp, ...) return a new UncertainArray whose uncertainty
+is propagated to first order, vectorized over the whole array. The inputs of
+each operation are taken as uncorrelated, so expressions using a quantity
+several times (x - x, x*x) must be propagated with propagate_uncertainty.
+"""
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
+
+from .utils.errors import UncertaintyError
+
+# Partial derivative of the unary ufuncs, from x and f(x)
+UNARY_DERIVATIVES = {
+    np.negative: lambda x, f: -1.0,
+    np.positive: lambda x, f: 1.0,
+    np.absolute: lambda x, f: np.sign(x),
+    np.square: lambda x, f: 2*x,
+    np.sqrt: lambda x, f: 0.5/f,
+    np.cbrt: lambda x, f: 1/(3*f**2),
+    np.reciprocal: lambda x, f: -f**2,
+    np.exp: lambda x, f: f,
+    np.exp2: lambda x, f: f*np.log(2),
+    np.expm1: lambda x, f: f + 1,
+    np.log: lambda x, f: 1/x,
+    np.log2: lambda x, f: 1/(x*np.log(2)),
+    np.log10: lambda x, f: 1/(x*np.log(10)),
+    np.log1p: lambda x, f: 1/(1 + x),
+    np.sin: lambda x, f: np.cos(x),
+    np.cos: lambda x, f: -np.sin(x),
+    np.tan: lambda x, f: 1 + f**2,
+    np.arcsin: lambda x, f: 1/np.sqrt(1 - x**2),
+    np.arccos: lambda x, f: -1/np.sqrt(1 - x**2),
+    np.arctan: lambda x, f: 1/(1 + x**2),
+    np.sinh: lambda x, f: np.cosh(x),
+    np.cosh: lambda x, f: np.sinh(x),
+    np.tanh: lambda x, f: 1 - f**2,
+    np.arcsinh: lambda x, f: 1/np.sqrt(x**2 + 1),
+    np.arccosh: lambda x, f: 1/np.sqrt(x**2 - 1),
+    np.arctanh: lambda x, f: 1/(1 - x**2),
+    np.deg2rad: lambda x, f: np.pi/180,
+    np.rad2deg: lambda x, f: 180/np.pi,
+}
+
+# Partial derivatives of the binary ufuncs, from x, y and f(x, y)
+BINARY_DERIVATIVES = {
+    np.add: (lambda x, y, f: 1.0, lambda x, y, f: 1.0),
+    np.subtract: (lambda x, y, f: 1.0, lambda x, y, f: -1.0),
+    np.multiply: (lambda x, y, f: y, lambda x, y, f: x),
+    np.true_divide: (lambda x, y, f: 1/y, lambda x, y, f: -f/y),
+    np.power: (lambda x, y, f: y*x**(y - 1), lambda x, y, f: f*np.log(x)),
+    np.arctan2: (lambda x, y, f: y/(x**2 + y**2), lambda x, y, f: -x/(x**2 + y**2)),
+    np.hypot: (lambda x, y, f: x/f, lambda x, y, f: y/f),
+}
+
+# Ufuncs of the values only, whose result has no uncertainty
+VALUE_UFUNCS = (
+    np.greater, np.greater_equal, np.less, np.less_equal, np.equal, np.not_equal,
+    np.isfinite, np.isinf, np.isnan, np.signbit,
+)
+
+class UncertainArray(NDArrayOperatorsMixin):
+    '''
+    Array of values with their uncertainties, stored as float NumPy arrays.
+    A constant uncertainty is kept as a 0-d array, broadcast when needed.
+
+    NumPy functions that aren't ufuncs (np.mean, plt.errorbar, ...) see the
+    values only, use the value & uncertainty attributes for the uncertainties.
+
+    Attributes:
+        - value: array, values
+        - uncertainty: array, uncertainties, broadcastable to the values
+    '''
+    def __init__(self, value, uncertainty=0.0):
+        # No copy for float arrays and pandas Series
+        self.value = np.asarray(value, dtype=float)
+        self.uncertainty = np.asarray(uncertainty, dtype=float)
+        if np.broadcast_shapes(self.value.shape, self.uncertainty.shape) != self.value.shape:
+            raise UncertaintyError(
+                f'Uncertainty of shape {self.uncertainty.shape} does not broadcast '
+                f'to the values of shape {self.value.shape}'
+            )
+
+    def __repr__(self):
+        return f'UncertainArray({self.value!r}, {self.uncertainty!r})'
+
+    @property
+    def shape(self):
+        return self.value.shape
+
+    @property
+    def ndim(self):
+        return self.value.ndim
+
+    @property
+    def size(self):
+        return self.value.size
+
+    def __len__(self):
+        return len(self.value)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.value, dtype=dtype)
+
+    def __getitem__(self, index):
+        uncertainty = self.uncertainty
+        if uncertainty.ndim:
+            uncertainty = np.broadcast_to(uncertainty, self.shape)[index]
+        return UncertainArray(self.value[index], uncertainty)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if kwargs.get('out') is not None:
+            return NotImplemented
+
+        values = [x.value if isinstance(x, UncertainArray) else x for x in inputs]
+
+        if method == '__call__' and ufunc in VALUE_UFUNCS:
+            return ufunc(*values, **kwargs)
+
+        if method == 'reduce' and ufunc is np.add:
+            # Sum of the values, uncertainties added in quadrature
+            (x,) = inputs
+            variance = np.broadcast_to(x.uncertainty, x.shape)**2
+            kwargs.pop('dtype', None)
+            return UncertainArray(
+                np.add.reduce(x.value, **kwargs), np.sqrt(np.add.reduce(variance, **kwargs))
+                )
+
+        if method != '__call__':
+            return NotImplemented
+        if ufunc in UNARY_DERIVATIVES:
+            derivatives = (UNARY_DERIVATIVES[ufunc],)
+        elif ufunc in BINARY_DERIVATIVES:
+            derivatives = BINARY_DERIVATIVES[ufunc]
+        else:
+            return NotImplemented
+
+        result = ufunc(*values, **kwargs)
+        # Only the derivatives of uncertain inputs are evaluated
+        terms = [
+            derivative(*values, result) * x.uncertainty
+            for x, derivative in zip(inputs, derivatives)
+            if isinstance(x, UncertainArray)
+            ]
+        if len(terms) == 1:
+            uncertainty = np.abs(terms[0])
+        else:
+            uncertainty = np.sqrt(sum(term**2 for term in terms))
+
+        return UncertainArray(result, np.broadcast_to(uncertainty, np.shape(result)))
+
+    def to_frame(self, name, units='UNITS'):
+        '''
+        DataFrame with the values and uncertainties, with the headers read
+        by get_excel_data_and_uncertainties.
+
+        Parameters:
+            - name: str, magnitude name
+            - units: str, units of the magnitude
+        Returns:
+            - pd.DataFrame, '{name} ({units})' & 'δ{name}' columns, or a single
+                '{name} ({uncertainty} {units})' column for a constant uncertainty
+        '''
+        import pandas as pd
+
+        if self.uncertainty.ndim == 0:
+            return pd.DataFrame({f'{name} ({self.uncertainty.item():g} {units})': self.value})
+        return pd.DataFrame({
+            f'{name} ({units})': self.value,
+            f'δ{name}': np.broadcast_to(self.uncertainty, self.shape),
+            })
+
+def split_uncertain(x, δx=None):
+    '''
+    Values and uncertainties of x, taken from x if it is an UncertainArray.
+    Constant uncertainties are returned as floats.
+
+    Parameters:
+        - x: UncertainArray or array-like, values
+        - δx: array-like or float, optional, uncertainties (override those of x)
+    Returns:
+        - x, δx: values and uncertainties
+    '''
+    if not isinstance(x, UncertainArray):
+        return x, δx
+    if δx is None:
+        δx = x.uncertainty.item() if x.uncertainty.ndim == 0 else x.uncertainty
+    return x.value, δx
@@ -0,0 +1,36 @@
+import warnings
+
+import numpy as np
+
+def as_arrays(inputs):
+    '''
+    Convert each input to an array, keeping scalars (constant values or
+    uncertainties) as they are, so they are broadcast instead of materialized.
+
+    Parameters:
+        - inputs: iterable of array-like or float
+    Returns:
+        - list of arrays or floats
+    '''
+    return [x if isinstance(x, (int, float)) else np.asarray(x, dtype=float) for x in inputs]
+
+def check_measurements(values, uncertainties=None, name='data'):
+    '''
+    Check measurements at once (vectorized), warning about non-finite values
+    and non-finite or negative uncertainties, which spoil the results.
+    Skipped (check=False) for data already checked, see UncertainTable.validate.
+
+    Parameters:
+        - values: array-like, values
+        - uncertainties: array-like or float, optional, uncertainties
+        - name: str, name of the data in the warnings
+    '''
+    if not np.all(np.isfinite(values)):
+        warnings.warn(f"Non-finite values (NaN or inf) found in {name}")
+    if uncertainties is None:
+        return
+    uncertainties = np.asarray(uncertainties, dtype=float)
+    if not np.all(np.isfinite(uncertainties)):
+        warnings.warn(f"Non-finite uncertainties (NaN or inf) found in {name}")
+    elif np.any(uncertainties < 0):
+        warnings.warn(f"Negative uncertainties found in {name}")
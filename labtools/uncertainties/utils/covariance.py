@@ -0,0 +1,100 @@
+import numpy as np
+
+from .errors import UncertaintyError
+
+def contract_covariance(jacobian, covariance):
+    '''
+    Contract the jacobian with the covariance matrix, J·Σ·Jᵀ, for all rows at once.
+
+    Parameters:
+        - jacobian: array, partial derivatives with shape (K, ...)
+        - covariance: array, covariance matrix, shared (K, K) or per row (..., K, K)
+    Returns:
+        - variance: array, propagated variance with shape (...)
+    '''
+    covariance = np.asarray(covariance, dtype=float)
+    K = len(jacobian)
+    if covariance.ndim < 2 or covariance.shape[-2:] != (K, K):
+        raise UncertaintyError(
+            f'Covariance matrix must have shape ({K}, {K}) or (N, {K}, {K}), '
+            f'got {covariance.shape}'
+        )
+    return np.einsum('i...,...ij,j...->...', jacobian, covariance, jacobian)
+
+def uncorrelated_variance(jacobian, uncertainties):
+    '''
+    Propagated variance of uncorrelated variables, Σ (∂f/∂xᵢ·δxᵢ)²,
+    without building their (diagonal) covariance matrix.
+
+    Parameters:
+        - jacobian: array, partial derivatives with shape (K, ...)
+        - uncertainties: list of array-like or float, uncertainties of the variables
+    Returns:
+        - variance: array, propagated variance with shape (...)
+    '''
+    return sum((diffx * δx)**2 for diffx, δx in zip(jacobian, uncertainties))
+
+def output_covariance(jacobians, uncertainties=None, covariance=None):
+    '''
+    Covariance matrix of several formulas of the same variables, J·Σ·Jᵀ,
+    from their stacked jacobians for all rows at once.
+
+    Parameters:
+        - jacobians: array, partial derivatives with shape (M, K, ...),
+            one row per formula and one column per variable
+        - uncertainties: list of array-like or float, uncertainties of the
+            variables, taken as uncorrelated (used if covariance is None)
+        - covariance: array, optional, covariance matrix of the variables,
+            shared (K, K) or per row (..., K, K)
+    Returns:
+        - covariance: array, covariance of the formulas with shape (..., M, M)
+    '''
+    if covariance is None:
+        # Uncorrelated variables: J·diag(δx²)·Jᵀ = (J·δx)·(J·δx)ᵀ
+        scaled = np.array(
+            [jacobians[:, k] * δx for k, δx in enumerate(uncertainties)]
+            ).swapaxes(0, 1)
+        return np.einsum('ik...,jk...->...ij', scaled, scaled)
+
+    covariance = np.asarray(covariance, dtype=float)
+    K = jacobians.shape[1]
+    if covariance.ndim < 2 or covariance.shape[-2:] != (K, K):
+        raise UncertaintyError(
+            f'Covariance matrix must have shape ({K}, {K}) or (N, {K}, {K}), '
+            f'got {covariance.shape}'
+        )
+    return np.einsum('ik...,...kl,jl...->...ij', jacobians, covariance, jacobians)
+
+def uncertainty_budget(jacobian, uncertainties, dependency='Independent'):
+    '''
+    Contribution of each variable to the propagated uncertainty, |∂f/∂xᵢ|·δxᵢ,
+    and its share as a percentage (of the variance for uncorrelated variables,
+    of the linear sum for the 'Dependent' dependency).
+
+    Parameters:
+        - jacobian: array, partial derivatives with shape (K, ...)
+        - uncertainties: list of array-like or float, uncertainties of the variables
+        - dependency: str, dependency type
+    Returns:
+        - contributions: array, |∂f/∂xᵢ|·δxᵢ with shape (K, ...)
+        - shares: array, percentage of each contribution with shape (K, ...)
+    '''
+    contributions = np.array(np.broadcast_arrays(
+        *(np.abs(diffx * δx) for diffx, δx in zip(jacobian, uncertainties))
+        ))
+    return contributions, budget_shares(contributions, dependency)
+
+def budget_shares(contributions, dependency='Independent'):
+    '''
+    Percentage of the propagated uncertainty due to each contribution,
+    nan where the uncertainty is zero.
+
+    Parameters:
+        - contributions: array, |∂f/∂xᵢ|·δxᵢ with shape (K, ...)
+        - dependency: str, dependency type
+    Returns:
+        - shares: array, percentages with shape (K, ...)
+    '''
+    weights = contributions if dependency == 'Dependent' else contributions**2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return 100 * weights / np.sum(weights, axis=0)
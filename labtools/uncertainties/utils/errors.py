@@ -0,0 +1,3 @@
+class UncertaintyError(Exception):
+    '''Custom exception for errors in uncertainty calculations'''
+    pass
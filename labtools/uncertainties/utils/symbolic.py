@@ -4,24 +4,38 @@ Created on Tue Jun 30 21:13:45 2020
 
 @author: Jorge Pottiez
 """
+import itertools
+import linecache
+
 import sympy as sp
+from sympy.printing.lambdarepr import NumExprPrinter
 
-class UncertaintyError(Exception):
-    '''Custom exception for errors in uncertainty calculations'''
-    pass
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
 
-def create_formula_and_uncertainty(variables_str, expression_str, dependency):
+from .errors import UncertaintyError
+
+# Numeric backends of the lambda functions
+BACKENDS = ('numpy', 'numexpr', 'math')
+# Unique file names of the numexpr kernels' source
+_numexpr_counter = itertools.count()
+
+def create_formula_and_gradient(variables_str, expression_str, definitions=None):
     '''
-    Create symbolic formulas for the given expression and its uncertainty.
-    The uncertainty is calculated based on the dependency of the variables.
+    Create the symbolic formula for the given expression, its gradient
+    and the uncertainty symbols of its variables.
 
     Parameters:
         - variables_str: string with the variables separated by commas
         - expression_str: string with the formula expression without "=" sign
-        - dependency: string with the dependency type ("Dependent" or "Independent")
+        - definitions: dict, optional, {name: symbolic expression of the variables}
+            of previous results, substituted wherever the expression uses them
     Returns:
         - formula_symb: symbolic expression for the formula
-        - uncertainty_symb: symbolic expression for the uncertainty
+        - gradient: list of partial derivatives (in the variables' order)
+        - uncertainties: list of uncertainty symbols (δx, δy, ...)
     '''
     # Initialise pretty printing
     sp.init_printing() # Installing LaTeX would give better results
@@ -35,6 +49,8 @@ def create_formula_and_uncertainty(variables_str, expression_str, dependency):
         variables_sy = [variables_sy]
     
     variables_dict = {k: v for k, v in zip(variables_list, variables_sy)}
+    if definitions:
+        variables_dict.update(definitions)
     
     # Convert formula to sympy
     try:
@@ -49,7 +65,22 @@ def create_formula_and_uncertainty(variables_str, expression_str, dependency):
         gradient.append( sp.diff(formula_symb,x) )
         uncertainties.append( sp.Symbol('δ' + str(x), positive = True) )
     
-    # Calculate uncertainty based on variable dependency
+    return formula_symb, gradient, uncertainties
+
+def combine_gradient(gradient, uncertainties, dependency):
+    '''
+    Combine the gradient terms into the symbolic uncertainty of the formula,
+    based on the dependency of the variables.
+
+    Parameters:
+        - gradient: list of partial derivatives
+        - uncertainties: list of uncertainty symbols
+        - dependency: string with the dependency type
+            ("Dependent", "Independent" or "Covariance"),
+            see combine_second_order for "SecondOrder"
+    Returns:
+        - uncertainty_symb: symbolic expression for the uncertainty
+    '''
     if dependency == 'Dependent':
         # Sum of absolutes
         uncertainty_symb = sum([ abs(diffx)*δx for (diffx, δx) in zip(gradient, uncertainties) ])
@@ -58,11 +89,87 @@ def create_formula_and_uncertainty(variables_str, expression_str, dependency):
         # Square root of sum of squares
         squares_sum = sum([ (diffx*δx)**2 for (diffx, δx) in zip(gradient, uncertainties) ])
         uncertainty_symb = sp.sqrt(squares_sum)
+    
+    elif dependency == 'Covariance':
+        # Square root of J·Σ·Jᵀ, with σ_xy the covariance between x & y
+        squares_sum = sum([ (diffx*δx)**2 for (diffx, δx) in zip(gradient, uncertainties) ])
+        for i, (diffx, δx) in enumerate(zip(gradient, uncertainties)):
+            for diffy, δy in zip(gradient[i+1:], uncertainties[i+1:]):
+                σxy = sp.Symbol(f'σ_{str(δx)[1:]}{str(δy)[1:]}', real = True)
+                squares_sum += 2*diffx*diffy*σxy
+        uncertainty_symb = sp.sqrt(squares_sum)
     else:
         raise UncertaintyError(
             f'Invalid dependency type: {dependency}. '
-            "Must be 'Dependent' or 'Independent'."
+            "Must be 'Dependent', 'Independent', 'Covariance' or 'SecondOrder'."
+        )
+    
+    return uncertainty_symb
+
+def create_hessian(variables_str, gradient):
+    '''
+    Create the (symmetric) Hessian matrix of a formula from its gradient.
+
+    Parameters:
+        - variables_str: string with the variables separated by commas
+        - gradient: list of partial derivatives
+    Returns:
+        - hessian: list of lists of second partial derivatives
+    '''
+    variables_sy = [sp.Symbol(v.strip(), real = True) for v in variables_str.split(',')]
+    K = len(variables_sy)
+    
+    hessian = [[None]*K for _ in range(K)]
+    for i in range(K):
+        for j in range(i, K):
+            hessian[i][j] = hessian[j][i] = sp.diff(gradient[i], variables_sy[j])
+    
+    return hessian
+
+def combine_second_order(formula_symb, gradient, hessian, uncertainties):
+    '''
+    Second-order value and uncertainty of a formula of independent,
+    normally distributed variables:
+        E[f]  ≈ f + ½·Σᵢ ∂²f/∂xᵢ²·δxᵢ²
+        Var f ≈ Σᵢ (∂f/∂xᵢ·δxᵢ)² + ½·Σᵢⱼ (∂²f/∂xᵢ∂xⱼ·δxᵢ·δxⱼ)²
+
+    Parameters:
+        - formula_symb: symbolic expression for the formula
+        - gradient: list of partial derivatives
+        - hessian: list of lists of second partial derivatives
+        - uncertainties: list of uncertainty symbols
+    Returns:
+        - value_symb: symbolic expression for the bias-corrected value
+        - uncertainty_symb: symbolic expression for the uncertainty
+    '''
+    K = len(uncertainties)
+    bias = sum([ hessian[i][i]*uncertainties[i]**2 for i in range(K) ]) / 2
+    
+    squares_sum = sum([ (diffx*δx)**2 for (diffx, δx) in zip(gradient, uncertainties) ])
+    for i, δx in enumerate(uncertainties):
+        squares_sum += (hessian[i][i]*δx**2)**2 / 2
+        for j in range(i+1, K):
+            squares_sum += (hessian[i][j]*δx*uncertainties[j])**2
+    
+    return formula_symb + bias, sp.sqrt(squares_sum)
+
+def create_formula_and_uncertainty(variables_str, expression_str, dependency):
+    '''
+    Create symbolic formulas for the given expression and its uncertainty.
+    The uncertainty is calculated based on the dependency of the variables.
+
+    Parameters:
+        - variables_str: string with the variables separated by commas
+        - expression_str: string with the formula expression without "=" sign
+        - dependency: string with the dependency type ("Dependent" or "Independent")
+    Returns:
+        - formula_symb: symbolic expression for the formula
+        - uncertainty_symb: symbolic expression for the uncertainty
+    '''
+    formula_symb, gradient, uncertainties = create_formula_and_gradient(
+        variables_str, expression_str
         )
+    uncertainty_symb = combine_gradient(gradient, uncertainties, dependency)
     
     return formula_symb, uncertainty_symb
 
@@ -89,4 +196,229 @@ def create_lambda_functions(variables_str, formula_symb, uncertainty_symb):
     except Exception as e:
         raise UncertaintyError('Error creating lambda functions: ' + str(e))
     
-    return formula_func, uncertainty_func
\ No newline at end of file
+    return formula_func, uncertainty_func
+
+def create_fused_function(
+        variables_str, formula_symb, gradient, uncertainties, dependency,
+        backend='numpy', hessian=None
+        ):
+    '''
+    Create a single lambda function returning both the formula and its
+    uncertainty. Common subexpressions of the formula and all its partial
+    derivatives are evaluated only once per call.
+
+    Parameters:
+        - variables_str: string with the variables separated by commas
+        - formula_symb: symbolic expression for the formula
+        - gradient: list of partial derivatives
+        - uncertainties: list of uncertainty symbols
+        - dependency: string with the dependency type
+            ("Dependent", "Independent" or "SecondOrder")
+        - backend: string with the numeric backend
+            ("numpy", "numexpr" for large arrays or "math" for scalars)
+        - hessian: list of lists of second partial derivatives ("SecondOrder" only)
+    Returns:
+        - fused_func: lambda function f(*values, *uncertainties) -> (value, uncertainty)
+    '''
+    return create_system_function(
+        variables_str, [formula_symb], [gradient], uncertainties, [dependency], backend,
+        [hessian]
+        )
+
+def create_system_function(
+        variables_str, formulas_symb, gradients, uncertainties, dependencies,
+        backend='numpy', hessians=None
+        ):
+    '''
+    Create a single lambda function returning several formulas of the same
+    variables and their uncertainties. Common subexpressions of all the
+    formulas and partial derivatives are evaluated only once per call.
+
+    Parameters:
+        - variables_str: string with the variables separated by commas
+        - formulas_symb: list of symbolic expressions for the formulas
+        - gradients: list of lists of partial derivatives (one per formula)
+        - uncertainties: list of uncertainty symbols
+        - dependencies: list of dependency types
+            ("Dependent", "Independent" or "SecondOrder")
+        - backend: string with the numeric backend
+            ("numpy", "numexpr" for large arrays or "math" for scalars)
+        - hessians: list of Hessian matrices (one per formula, None unless "SecondOrder")
+    Returns:
+        - system_func: lambda function
+            f(*values, *uncertainties) -> (value_1, uncertainty_1, value_2, ...)
+    '''
+    # Variable names for function arguments
+    uncertainties_str = ','.join( 'δ' + x.strip() for x in variables_str.split(',') )
+    all_variables_str = variables_str + ',' + uncertainties_str
+    
+    K = len(uncertainties)
+    if hessians is None:
+        hessians = [None] * len(formulas_symb)
+    # Upper triangle of the Hessians
+    upper = lambda hessian: (
+        [] if hessian is None else [hessian[i][j] for i in range(K) for j in range(i, K)]
+        )
+    
+    # Shared subexpressions between all the formulas and their derivatives
+    expressions, sizes = [], []
+    for formula_symb, gradient, hessian in zip(formulas_symb, gradients, hessians):
+        terms = [formula_symb, *gradient, *upper(hessian)]
+        expressions += terms
+        sizes.append(len(terms))
+    replacements, reduced = sp.cse(expressions)
+    
+    outputs = []
+    start = 0
+    for dependency, size in zip(dependencies, sizes):
+        value, *derivatives = reduced[start : start+size]
+        partials, second = derivatives[:K], derivatives[K:]
+        start += size
+        if dependency == 'SecondOrder':
+            hessian = [[None]*K for _ in range(K)]
+            pairs = [(i, j) for i in range(K) for j in range(i, K)]
+            for (i, j), h in zip(pairs, second):
+                hessian[i][j] = hessian[j][i] = h
+            outputs += combine_second_order(value, partials, hessian, uncertainties)
+        else:
+            outputs += [value, combine_gradient(partials, uncertainties, dependency)]
+    outputs = tuple(outputs)
+    
+    if backend not in BACKENDS:
+        raise UncertaintyError(
+            f'Invalid backend: {backend}. Must be one of {BACKENDS}.'
+        )
+    try:
+        if backend == 'numexpr':
+            system_func = _lambdify_numexpr(all_variables_str, replacements, outputs)
+        else:
+            system_func = sp.lambdify(
+                all_variables_str, outputs, modules=backend,
+                cse=lambda exprs: (replacements, exprs)
+                )
+    except UncertaintyError:
+        raise
+    except Exception as e:
+        raise UncertaintyError('Error creating lambda functions: ' + str(e))
+    
+    return system_func
+
+def _lambdify_numexpr(arguments_str, replacements, exprs):
+    '''
+    Lambdify with numexpr, evaluating each subexpression in a single
+    multithreaded pass without temporary arrays.
+    (sympy's lambdify can't combine numexpr with common subexpressions)
+    A single expression (not in a list) is returned as is, not in a tuple.
+    '''
+    if numexpr is None:
+        raise UncertaintyError("The 'numexpr' backend requires numexpr to be installed")
+    
+    printer = NumExprPrinter()
+    # numexpr can't access constants such as math.pi, use their values
+    doprint = lambda expr: printer.doprint(
+        expr.xreplace({c: sp.Float(c, 17) for c in expr.atoms(sp.NumberSymbol)})
+        )
+    lines = [f'def _numexprgenerated({arguments_str}):']
+    for symbol, expr in replacements:
+        lines.append(f'    {symbol} = {doprint(expr)}')
+    if isinstance(exprs, sp.Basic):
+        lines.append(f'    return {doprint(exprs)}')
+    else:
+        returns = ', '.join(doprint(expr) for expr in exprs)
+        lines.append(f'    return ({returns},)')
+    
+    # Register the source, as lambdify does, so that inspect can retrieve it
+    source = '\n'.join(lines) + '\n'
+    filename = f'<numexprgenerated-{next(_numexpr_counter)}>'
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    
+    namespace = {'numexpr': numexpr}
+    exec(compile(source, filename, 'exec'), namespace)
+    return namespace['_numexprgenerated']
+
+def create_formula_function(variables_str, formula_symb, backend='numpy'):
+    '''
+    Create the lambda function of the formula alone, for a numeric backend
+    (e.g. to evaluate many samples of the variables).
+
+    Parameters:
+        - variables_str: string with the variables separated by commas
+        - formula_symb: symbolic expression for the formula
+        - backend: string with the numeric backend
+            ("numpy", "numexpr" for large arrays or "math" for scalars)
+    Returns:
+        - formula_func: lambda function f(*values) -> value
+    '''
+    if backend not in BACKENDS:
+        raise UncertaintyError(
+            f'Invalid backend: {backend}. Must be one of {BACKENDS}.'
+        )
+    try:
+        if backend == 'numexpr':
+            replacements, (reduced,) = sp.cse([formula_symb])
+            formula_func = _lambdify_numexpr(variables_str, replacements, reduced)
+        else:
+            formula_func = sp.lambdify(variables_str, formula_symb, modules=backend)
+    except UncertaintyError:
+        raise
+    except Exception as e:
+        raise UncertaintyError('Error creating lambda functions: ' + str(e))
+    
+    return formula_func
+
+def create_jacobian_function(variables_str, formula_symb, gradient):
+    '''
+    Create a single lambda function returning the formula and all its
+    partial derivatives, sharing their common subexpressions.
+
+    Parameters:
+        - variables_str: string with the variables separated by commas
+        - formula_symb: symbolic expression for the formula
+        - gradient: list of partial derivatives
+    Returns:
+        - jacobian_func: lambda function f(*values) -> (value, (∂f/∂x, ∂f/∂y, ...))
+    '''
+    replacements, (value, *partials) = sp.cse([formula_symb, *gradient])
+    
+    try:
+        jacobian_func = sp.lambdify(
+            variables_str, (value, tuple(partials)),
+            cse=lambda exprs: (replacements, exprs)
+            )
+    except Exception as e:
+        raise UncertaintyError('Error creating lambda functions: ' + str(e))
+    
+    return jacobian_func
+
+def create_system_jacobian_function(variables_str, formulas_symb, gradients):
+    '''
+    Create a single lambda function returning several formulas of the same
+    variables and their partial derivatives, sharing their common subexpressions.
+
+    Parameters:
+        - variables_str: string with the variables separated by commas
+        - formulas_symb: list of symbolic expressions for the formulas
+        - gradients: list of lists of partial derivatives (one per formula)
+    Returns:
+        - jacobian_func: lambda function
+            f(*values) -> ((value_1, value_2, ...), ((∂f_1/∂x, ∂f_1/∂y, ...), ...))
+    '''
+    K = len(gradients[0])
+    replacements, reduced = sp.cse(
+        [term for formula_symb, gradient in zip(formulas_symb, gradients)
+         for term in (formula_symb, *gradient)]
+        )
+    values = tuple(reduced[::K + 1])
+    partials = tuple(
+        tuple(reduced[start + 1 : start + K + 1]) for start in range(0, len(reduced), K + 1)
+        )
+    
+    try:
+        jacobian_func = sp.lambdify(
+            variables_str, (values, partials),
+            cse=lambda exprs: (replacements, exprs)
+            )
+    except Exception as e:
+        raise UncertaintyError('Error creating lambda functions: ' + str(e))
+    
+    return jacobian_func
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from labtools.data import unload_excel, unload_csv, UncertainTable
+from labtools.uncertainties import UncertainArray
+
+def read_table(path):
+    if path.endswith('.csv'):
+        return UncertainTable.from_dataframe(pd.read_csv(path))
+    return UncertainTable.from_dataframe(pd.read_excel(path))
+
+@pytest.mark.parametrize('unload', [unload_excel, unload_csv])
+def test_unload_uncertain_array(unload, tmp_path):
+    x = UncertainArray([1.0, 2.0, 3.0], [0.1, 0.2, 0.3])
+    table = read_table(unload('x', x, directory=str(tmp_path)))
+    np.testing.assert_allclose(table.value('x'), x.value)
+    np.testing.assert_allclose(table.uncertainty('x'), x.uncertainty)
+
+@pytest.mark.parametrize('unload', [unload_excel, unload_csv])
+def test_unload_dict_of_uncertain_arrays(unload, tmp_path):
+    data = {
+        't': UncertainArray([1.0, 2.0, 3.0], 0.5),
+        'v': UncertainArray([4.0, 5.0, 6.0], [0.1, 0.2, 0.3]),
+        }
+    table = read_table(unload('data', data, directory=str(tmp_path)))
+    assert table.magnitudes == ('t', 'v')
+    assert table.uncertainty('t') == 0.5
+    np.testing.assert_allclose(table.value('v'), data['v'].value)
+    np.testing.assert_allclose(table.uncertainty('v'), data['v'].uncertainty)
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from labtools.uncertainties.format_round import round_with_uncertainty, rounder
+
+TIES = [
+    (47.365, 0.147),
+    (92.55, 0.474),
+    (0.095, 0.0095),
+    (2.5, 0.5),
+    (0.125, 0.03),
+    (1.0005, 0.0012),
+]
+
+@pytest.mark.parametrize('notation', ['standard', 'sci'])
+def test_rounder_matches_scalar_on_ties(notation):
+    values, uncertainties = zip(*TIES)
+    expected = [round_with_uncertainty(x, δx, notation) for x, δx in TIES]
+    assert rounder(list(values), list(uncertainties), notation) == expected
+
+@pytest.mark.parametrize('notation', ['standard', 'sci'])
+def test_rounder_matches_scalar_on_lab_values(notation):
+    rng = np.random.default_rng(0)
+    values = np.round(rng.uniform(0, 100, 20_000), 3).tolist()
+    uncertainties = np.round(rng.uniform(0.0005, 1, 20_000), 4).tolist()
+    expected = [
+        round_with_uncertainty(x, δx, notation) for x, δx in zip(values, uncertainties)
+        ]
+    assert rounder(values, uncertainties, notation) == expected
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from labtools.data import UncertainTable
+
+def test_round_trip_keeps_assumed_and_other_columns():
+    dataframe = pd.DataFrame({
+        'Sample': ['a', 'b', 'c'],
+        'x (0.1 s)': [1.0, 2.0, 3.0],
+        'y (1/s)': [4.0, 5.0, 6.0],
+        'z (m)': [7.0, 8.0, 9.0],
+        'δz': [0.1, 0.2, 0.3],
+        'Notes (text)': ['ok', 'bad', 'ok'],
+        })
+    table = UncertainTable.from_dataframe(dataframe)
+    assert table.assumed == {'y'}
+
+    written = table.to_dataframe()
+    assert 'y (1/s)' in written.columns
+    assert list(written['Sample']) == ['a', 'b', 'c']
+    assert list(written['Notes (text)']) == ['ok', 'bad', 'ok']
+
+    read = UncertainTable.from_dataframe(written)
+    assert read.magnitudes == table.magnitudes
+    assert read.assumed == {'y'}
+    assert read.uncertainty('x') == 0.1
+    np.testing.assert_allclose(read.uncertainty('z'), [0.1, 0.2, 0.3])
+    assert read.validate()['valid']